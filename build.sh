@@ -10,4 +10,11 @@ pip install -r requirements.txt
 python manage.py collectstatic --no-input
 
 # Run database migrations
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py createcachetable
+
+# Precompute per-user recommendations
+python manage.py rebuild_recommendations
+
+# Resize any posters that have no renditions yet
+python manage.py build_poster_renditions
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""Rating activity per calendar week, month or year for the admin chart.
+
+Everything is read from the ``DailyActivity`` rollup, so the cost of a series
+depends on the number of days it covers, not the number of ratings:
+
+- ratings and new users are plain per-day totals, summed per bucket by one
+  grouped query (``rollup_series``)
+- distinct active users cannot be summed across days, so each day also keeps
+  a mergeable sketch of its raters (see ``moviehub.sketches``); the sketches
+  of a bucket's days are merged at query time (``active_users`` and
+  ``active_users_between``). Counts are exact while user ids stay below
+  ``sketches.BITSET_MAX_ID`` and within about 1.6% (one standard error)
+  beyond that.
+
+Buckets with no activity are filled with zeros, so asking for 52 weeks costs
+the same single query as 4. The rollup is kept in step by the signal handlers
+(``record_rating``, ``record_new_user``, ``rebuild_days``) and can be rebuilt
+with ``manage.py rebuild_activity_rollups``.
+"""
+import datetime
+from itertools import groupby
+from operator import itemgetter
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .models import DailyActivity, Rating, UserProfile
+from .sketches import UserSketch, merged_count
+
+ACTIVE_USERS = 'active_users'
+RATINGS = 'ratings'
+NEW_USERS = 'new_users'
+ROLLUP_METRICS = (RATINGS, NEW_USERS)
+
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+YEARLY = 'yearly'
+
+_TRUNC = {WEEKLY: TruncWeek, MONTHLY: TruncMonth, YEARLY: TruncYear}
+
+
+def _bucket_start(unit, day):
+    if unit == WEEKLY:
+        return day - datetime.timedelta(days=day.weekday())
+    if unit == MONTHLY:
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def _shift(unit, start, n):
+    """Start of the bucket ``n`` buckets after (or before, if negative) ``start``."""
+    if unit == WEEKLY:
+        return start + datetime.timedelta(weeks=n)
+    if unit == MONTHLY:
+        months = start.month - 1 + n
+        return datetime.date(start.year + months // 12, months % 12 + 1, 1)
+    return datetime.date(start.year + n, 1, 1)
+
+
+def buckets(unit, periods, now=None):
+    """The last ``periods`` buckets of ``unit``, oldest first, as ``(start, end)``.
+
+    ``start`` is the first day of the bucket and ``end`` the first day of the
+    next one, both dates in the current time zone.
+    """
+    today = timezone.localdate(now or timezone.now())
+    current = _bucket_start(unit, today)
+    starts = [_shift(unit, current, -i) for i in range(periods - 1, -1, -1)]
+    return [(start, _shift(unit, start, 1)) for start in starts]
+
+
+def _as_datetime(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def active_users_between(start, end):
+    """Distinct users who rated on days ``start`` (inclusive) to ``end`` (exclusive)."""
+    sketches = (
+        DailyActivity.objects
+        .filter(day__gte=start, day__lt=end)
+        .values_list('raters_sketch', flat=True)
+    )
+    return merged_count(sketches)
+
+
+def active_users(unit, periods, now=None):
+    """Distinct users who rated in each bucket.
+
+    Returns a list of ``{'start', 'end', 'count'}`` dicts, oldest first, where
+    ``end`` is exclusive.
+    """
+    if unit not in _TRUNC:
+        raise ValueError(f'Unknown activity unit: {unit!r}')
+    ranges = buckets(unit, periods, now=now)
+    if not ranges:
+        return []
+    rows = (
+        DailyActivity.objects
+        .filter(day__gte=ranges[0][0], day__lt=ranges[-1][1])
+        .values_list('day', 'raters_sketch')
+    )
+    per_bucket = {}
+    for day, raw in rows:
+        per_bucket.setdefault(_bucket_start(unit, day), []).append(raw)
+    return [
+        {'start': start, 'end': end, 'count': merged_count(per_bucket.get(start, []))}
+        for start, end in ranges
+    ]
+
+
+def rollup_series(unit, periods, metric, now=None):
+    """Per-bucket totals of a ``DailyActivity`` column (``ratings`` or ``new_users``).
+
+    Same shape as ``active_users``, from one grouped query over the rollup.
+    """
+    if unit not in _TRUNC:
+        raise ValueError(f'Unknown activity unit: {unit!r}')
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f'Unknown rollup metric: {metric!r}')
+    ranges = buckets(unit, periods, now=now)
+    if not ranges:
+        return []
+    rows = (
+        DailyActivity.objects
+        .filter(day__gte=ranges[0][0], day__lt=ranges[-1][1])
+        .annotate(bucket=_TRUNC[unit]('day'))
+        .values('bucket')
+        .annotate(total=Sum(metric))
+        .order_by()
+        .values_list('bucket', 'total')
+    )
+    counts = dict(rows)
+    return [{'start': start, 'end': end, 'count': counts.get(start) or 0} for start, end in ranges]
+
+
+def series(unit, periods, metric=ACTIVE_USERS, now=None):
+    if metric == ACTIVE_USERS:
+        return active_users(unit, periods, now=now)
+    return rollup_series(unit, periods, metric, now=now)
+
+
+def day_of(value):
+    return timezone.localdate(value) if value else None
+
+
+def _day_range(day):
+    return _as_datetime(day), _as_datetime(day + datetime.timedelta(days=1))
+
+
+def _bump(day, **deltas):
+    DailyActivity.objects.get_or_create(day=day)
+    DailyActivity.objects.filter(day=day).update(**{name: F(name) + delta for name, delta in deltas.items()})
+
+
+def record_rating(rating):
+    """Count a newly created rating in its day's rollup row.
+
+    The row is locked before its sketch is read, and ``raters`` is taken from
+    the sketch with the rater added, so two concurrent first ratings of the
+    same user both leave it counted once. Like every count read from the
+    sketches, it is exact below ``sketches.BITSET_MAX_ID`` and an estimate
+    beyond; ``rebuild`` restores the exact figure.
+    """
+    day = day_of(rating.created_at)
+    if day is None:
+        return
+    with transaction.atomic():
+        locked = DailyActivity.objects.select_for_update()
+        row = locked.filter(day=day).first() or locked.get_or_create(day=day)[0]
+        sketch = UserSketch.from_bytes(row.raters_sketch).add([rating.user_id])
+        DailyActivity.objects.filter(pk=row.pk).update(
+            ratings=F('ratings') + 1, raters=sketch.count(), raters_sketch=sketch.to_bytes(),
+        )
+
+
+def record_new_user(user):
+    day = day_of(user.date_joined)
+    if day is not None:
+        with transaction.atomic():
+            _bump(day, new_users=1)
+
+
+def _daily_totals(days=None, since=None):
+    """``{day: {'ratings', 'raters', 'new_users'}}`` computed from the source tables.
+
+    Restricted to the given ``days``, or to ``since`` onwards; all history when
+    neither is given.
+    """
+    ratings = Rating.objects.filter(created_at__isnull=False)
+    users = User.objects.all()
+    if since is not None:
+        ratings = ratings.filter(created_at__gte=_as_datetime(since))
+        users = users.filter(date_joined__gte=_as_datetime(since))
+    if days is not None:
+        in_ratings, in_users = Q(pk__in=[]), Q(pk__in=[])
+        for day in days:
+            start, end = _day_range(day)
+            in_ratings |= Q(created_at__gte=start, created_at__lt=end)
+            in_users |= Q(date_joined__gte=start, date_joined__lt=end)
+        ratings, users = ratings.filter(in_ratings), users.filter(in_users)
+    totals = {}
+
+    def row(day):
+        return totals.setdefault(day, {'ratings': 0, 'raters': 0, 'new_users': 0, 'raters_sketch': b''})
+
+    rating_rows = (
+        ratings.annotate(day=TruncDate('created_at')).values('day')
+        .annotate(ratings=Count('id'), raters=Count('user', distinct=True))
+        .order_by().values_list('day', 'ratings', 'raters')
+    )
+    for day, count, raters in rating_rows:
+        row(day).update(ratings=count, raters=raters)
+    rater_rows = (
+        ratings.annotate(day=TruncDate('created_at'))
+        .values_list('day', 'user_id').distinct().order_by('day')
+    )
+    for day, user_ids in groupby(rater_rows.iterator(), key=itemgetter(0)):
+        row(day)['raters_sketch'] = UserSketch.of(u for _, u in user_ids).to_bytes()
+    user_rows = (
+        users.annotate(day=TruncDate('date_joined')).values('day')
+        .annotate(new_users=Count('id'))
+        .order_by().values_list('day', 'new_users')
+    )
+    for day, count in user_rows:
+        row(day)['new_users'] = count
+    return totals
+
+
+def _replace_rows(totals, stale):
+    with transaction.atomic():
+        stale.delete()
+        DailyActivity.objects.bulk_create(
+            [DailyActivity(day=day, **values) for day, values in sorted(totals.items())]
+        )
+    return len(totals)
+
+
+def rebuild(since=None):
+    """Recompute every rollup row from ``since`` (a date; all history when omitted)."""
+    stale = DailyActivity.objects.all()
+    if since is not None:
+        stale = stale.filter(day__gte=since)
+    return _replace_rows(_daily_totals(since=since), stale)
+
+
+def rebuild_days(days):
+    """Recompute the rollup rows for a handful of ``days`` (used after deletes)."""
+    days = sorted({d for d in days if d is not None})
+    if not days:
+        return 0
+    return _replace_rows(_daily_totals(days=days), DailyActivity.objects.filter(day__in=days))
+
+
+def touch_raters(user_ids, when=None):
+    """Stamp ``UserProfile.ratings_changed_at`` for users whose rating count changed.
+
+    Creates the profile when a user has none yet; users that no longer exist
+    (deleted along with their ratings) are skipped.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    when = when or timezone.now()
+    with transaction.atomic():
+        stamped = UserProfile.objects.filter(user_id__in=user_ids)
+        missing = user_ids - set(stamped.values_list('user_id', flat=True))
+        stamped.update(ratings_changed_at=when)
+        if missing:
+            existing = User.objects.filter(id__in=missing).values_list('id', flat=True)
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user_id, ratings_changed_at=when) for user_id in existing],
+                ignore_conflicts=True,
+            )
@@ -5,7 +5,7 @@ from .models import Movie, Rating
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
     list_display = ('title', 'genre', 'release_year', 'average_rating_display')
-    list_filter = ('genre', 'release_year')
+    list_filter = ('genres', 'release_year')
     search_fields = ('title', 'genre', 'description')
     readonly_fields = ('average_rating_display',)
     
@@ -25,7 +25,7 @@ class MovieAdmin(admin.ModelAdmin):
     def average_rating_display(self, obj):
         rating = obj.average_rating()
         if rating > 0:
-            return f"⭐ {rating}/5 ({obj.ratings.count()} ratings)"
+            return f"⭐ {rating}/5 ({obj.rating_count} ratings)"
         return "No ratings yet"
     
     average_rating_display.short_description = "Average Rating"
@@ -34,7 +34,7 @@ class MovieAdmin(admin.ModelAdmin):
 @admin.register(Rating)
 class RatingAdmin(admin.ModelAdmin):
     list_display = ('user', 'movie', 'value', 'formatted_rating')
-    list_filter = ('value', 'movie__genre')
+    list_filter = ('value', 'movie__genres')
     search_fields = ('user__username', 'movie__title')
     readonly_fields = ('user', 'movie', 'value')
 
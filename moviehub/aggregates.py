@@ -0,0 +1,53 @@
+"""Helpers for the denormalized Movie.rating_sum / Movie.rating_count columns."""
+from django.db.models import (
+    Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import Movie, Rating
+
+
+def apply_rating_delta(movie_id, sum_delta, count_delta=0):
+    """Atomically shift one movie's aggregates without reading them first."""
+    if not sum_delta and not count_delta:
+        return
+    Movie.objects.filter(pk=movie_id).update(
+        rating_sum=F('rating_sum') + sum_delta,
+        rating_count=F('rating_count') + count_delta,
+    )
+
+
+def _actual_aggregates():
+    per_movie = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    actual_sum = per_movie.annotate(total=Sum('value')).values('total')
+    actual_count = per_movie.annotate(total=Count('id')).values('total')
+    return (
+        Coalesce(Subquery(actual_sum, output_field=IntegerField()), Value(0)),
+        Coalesce(Subquery(actual_count, output_field=IntegerField()), Value(0)),
+    )
+
+
+def drifted_movies(movies=None):
+    """Movies whose stored aggregates disagree with their Rating rows."""
+    actual_sum, actual_count = _actual_aggregates()
+    movies = Movie.objects.all() if movies is None else movies
+    return movies.annotate(actual_sum=actual_sum, actual_count=actual_count).filter(
+        ~Q(rating_sum=F('actual_sum')) | ~Q(rating_count=F('actual_count'))
+    )
+
+
+def recompute_rating_aggregates(movies=None):
+    """Rewrite aggregates from the Rating table in one UPDATE; returns rows touched."""
+    actual_sum, actual_count = _actual_aggregates()
+    movies = Movie.objects.all() if movies is None else movies
+    return movies.update(rating_sum=actual_sum, rating_count=actual_count)
+
+
+def top_rated(movies, limit=5):
+    """Highest-average movies of ``movies`` as one ORDER BY ... LIMIT query."""
+    average = Case(
+        When(rating_count__gt=0, then=F('rating_sum') * 1.0 / F('rating_count')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return list(movies.annotate(avg_rating=average).order_by('-avg_rating', 'id')[:limit])
@@ -5,3 +5,6 @@ class FilmoracleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'moviehub'
     verbose_name = 'FilmOracle'
+
+    def ready(self):
+        from . import signals  # noqa: F401
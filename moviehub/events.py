@@ -0,0 +1,205 @@
+"""Server-sent events for open dashboards, served under ASGI.
+
+Each connected browser holds one ``/api/events/`` stream instead of polling.
+The stream carries small notifications, and the page then fetches what
+changed from the usual JSON endpoints (which answer with ETags):
+
+- ``catalog``: the CatalogEvent journal moved on (``{"cursor": seq}``); the
+  page reads ``/api/movies/changes/`` from its own cursor
+- ``top-picks``: this user's stored recommendations were rewritten; the page
+  reloads ``/api/top-picks/``
+
+Every worker process runs one ``Broker``. It keeps the open streams of that
+process and fans each message out to them, while a single backend task per
+process watches for changes, so the cost of noticing a change does not grow
+with the number of open pages. The backend is chosen by the
+``MOVIEHUB_EVENTS_BACKEND`` setting (a dotted path to a ``Backend`` subclass).
+The default ``JournalBackend`` makes one read of the version tokens in the
+shared cache, which every worker can see, per ``MOVIEHUB_EVENTS_INTERVAL``
+seconds: the catalog token and the picks token of each connected user
+together. It only queries the catalog journal when the catalog token moved.
+
+The polling endpoints stay in place: pages fall back to them whenever the
+stream is unavailable (e.g. under WSGI, where ``/api/events/`` answers 204).
+"""
+import abc
+import asyncio
+import contextvars
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils.module_loading import import_string
+
+from . import versions
+from .models import CatalogEvent
+
+CATALOG = 'catalog'
+TOP_PICKS = 'top-picks'
+
+# Notifications only say "something changed", so a subscriber that falls this
+# far behind loses nothing by missing a few: the next one covers them.
+SUBSCRIBER_BUFFER = 16
+
+
+def format_message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One open stream: a user and the messages waiting to be sent to them."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+    async def get(self, timeout):
+        """The next formatted message, or None if none arrived within ``timeout``."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Backend(abc.ABC):
+    """Where a broker learns about changes.
+
+    ``run`` is started when the first stream of a process opens and should
+    call ``broker.publish`` for each change until ``broker.active()`` is
+    False. A backend fed by an external pub/sub (Redis, PostgreSQL
+    LISTEN/NOTIFY, ...) subclasses this and publishes as messages arrive.
+    """
+
+    @abc.abstractmethod
+    async def run(self, broker):
+        """Publish changes to ``broker`` while it has open streams."""
+
+
+class JournalBackend(Backend):
+    """Checks the version tokens on a fixed interval, and the journal when the catalog moved."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'MOVIEHUB_EVENTS_INTERVAL', 1.0)
+        self.reset()
+
+    def reset(self):
+        self._catalog_token = None
+        self._cursor = None
+        self._seen = {}
+
+    @staticmethod
+    def _latest_seq():
+        try:
+            return CatalogEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+        except Exception:
+            # Drop a broken connection so the next check reconnects.
+            close_old_connections()
+            return None
+
+    def poll(self, user_ids):
+        """One check: ``(event, data, user_id)`` for each change since the last one.
+
+        The first check after ``reset`` only records where things stand.
+        """
+        found = versions.peek(
+            versions.CATALOG, *((versions.RECOMMENDATIONS, user_id) for user_id in user_ids)
+        )
+        messages = []
+        catalog_token = found and found[versions.CATALOG]
+        # A missing token (cache cleared or unreadable) says nothing; look.
+        if catalog_token is None or catalog_token != self._catalog_token:
+            seq = self._latest_seq()
+            if seq is not None:
+                if self._cursor is not None and seq > self._cursor:
+                    messages.append((CATALOG, {'cursor': seq}, None))
+                self._cursor = seq
+                self._catalog_token = catalog_token
+        if found is None:
+            return messages
+        seen = {}
+        for user_id in user_ids:
+            token = found[(versions.RECOMMENDATIONS, user_id)]
+            if user_id in self._seen and self._seen[user_id] != token:
+                messages.append((TOP_PICKS, {}, user_id))
+            seen[user_id] = token
+        self._seen = seen
+        return messages
+
+    async def run(self, broker):
+        poll = sync_to_async(self.poll)
+        self.reset()
+        await poll(broker.user_ids())
+        while broker.active():
+            await asyncio.sleep(self.interval)
+            for event, data, user_id in await poll(broker.user_ids()):
+                broker.publish(event, data, user_id=user_id)
+
+
+class Broker:
+    """Fans messages out to the open streams of this process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = set()
+        self._task = None
+        self._loop = None
+
+    def active(self):
+        return bool(self._subscriptions)
+
+    def user_ids(self):
+        return sorted({s.user_id for s in self._subscriptions})
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        self._subscriptions.add(subscription)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            if self._task is not None and not self._task.done():
+                # Only ever one backend task per process: stop the one left on an old loop.
+                try:
+                    self._loop.call_soon_threadsafe(self._task.cancel)
+                except RuntimeError:
+                    pass  # that loop is closed, and its task with it
+            self._loop = loop
+            # Run outside the opening request's context: its sync_to_async
+            # executor goes away with that request, the backend must not.
+            self._task = contextvars.Context().run(loop.create_task, self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, event, data, user_id=None):
+        """Queue a message for every stream, or only for ``user_id``'s streams."""
+        message = format_message(event, data)
+        for subscription in list(self._subscriptions):
+            if user_id is not None and subscription.user_id != user_id:
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                pass
+
+    async def _run(self):
+        while self.active():
+            try:
+                await self.backend.run(self)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Keep the streams alive through a failing backend; retry shortly.
+                await asyncio.sleep(getattr(settings, 'MOVIEHUB_EVENTS_INTERVAL', 1.0))
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'MOVIEHUB_EVENTS_BACKEND', 'moviehub.events.JournalBackend')
+        _broker = Broker(import_string(path)())
+    return _broker
@@ -0,0 +1,64 @@
+"""Cached filter facets (genres and release years) with per-value counts.
+
+The lists only change when the catalog does, so they are computed with two
+grouped queries, kept in the cache and dropped by the Movie signal handlers
+on save, archive, restore and delete.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Genre, Movie
+
+FACETS_CACHE_KEY = 'moviehub:facets'
+# Safety net for writes that bypass the signal handlers (bulk updates, shell).
+FACETS_CACHE_TIMEOUT = 60 * 60
+
+
+def _compute_facets():
+    genre_rows = (
+        Genre.objects
+        .annotate(
+            total=Count('movies'),
+            active=Count('movies', filter=Q(movies__archived_at__isnull=True)),
+        )
+        .filter(total__gt=0)
+        .order_by('name')
+        .values_list('name', 'active')
+    )
+    year_rows = (
+        Movie.objects.filter(archived_at__isnull=True)
+        .values_list('release_year')
+        .annotate(count=Count('id'))
+        .order_by('-release_year')
+    )
+    return {
+        # Every genre used by any movie (archived included), for the admin filter
+        'all_genres': [{'name': name, 'count': active} for name, active in genre_rows],
+        # Genres with at least one visible movie, for the user dashboard
+        'genres': [{'name': name, 'count': active} for name, active in genre_rows if active],
+        # Release years of visible movies, newest first
+        'years': [{'year': year, 'count': count} for year, count in year_rows if year],
+    }
+
+
+def get_facets():
+    """Return the facet dict, computing and caching it on a miss."""
+    try:
+        facets = cache.get(FACETS_CACHE_KEY)
+    except Exception:
+        # Cache backend unavailable (e.g. cache table not created yet)
+        return _compute_facets()
+    if facets is None:
+        facets = _compute_facets()
+        try:
+            cache.set(FACETS_CACHE_KEY, facets, FACETS_CACHE_TIMEOUT)
+        except Exception:
+            pass
+    return facets
+
+
+def invalidate_facets():
+    try:
+        cache.delete(FACETS_CACHE_KEY)
+    except Exception:
+        pass
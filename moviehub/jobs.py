@@ -0,0 +1,97 @@
+"""A small database-backed job queue for work that should not hold a request.
+
+``enqueue(func, **kwargs)`` records a ``Job`` naming a module-level function
+by its dotted path, and ``manage.py run_worker`` calls it later with those
+keyword arguments (which must be JSON-serializable). The job row is written in
+the caller's transaction, so a job never runs before the data it refers to is
+committed, and is never left behind if that transaction rolls back.
+
+Workers claim a job with a conditional UPDATE (pending -> running), which
+works the same on SQLite and PostgreSQL and lets any number of workers share
+the table. A job that raises is retried with a growing delay up to
+``MAX_ATTEMPTS`` times and then marked failed with its last error. Jobs left
+running by a worker that died are handed out again after ``STALE_AFTER``.
+
+Setting ``MOVIEHUB_JOBS_INLINE = True`` runs each job in-process right after
+the enqueuing transaction commits, for development without a worker; the
+settings turn it on whenever ``DEBUG`` is.
+"""
+import datetime
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = datetime.timedelta(seconds=30)
+STALE_AFTER = datetime.timedelta(minutes=15)
+KEEP_FINISHED = datetime.timedelta(days=7)
+
+
+def task_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, **kwargs):
+    job = Job.objects.create(task=task_path(func), kwargs=kwargs)
+    if getattr(settings, 'MOVIEHUB_JOBS_INLINE', False):
+        job_id = job.id
+        transaction.on_commit(lambda: run(claim(job_id)))
+    return job
+
+
+def claim(job_id=None):
+    """Mark the next due job (or ``job_id``) as running and return it; None if none."""
+    now = timezone.now()
+    pending = Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+    if job_id is not None:
+        pending = pending.filter(pk=job_id)
+    # Another worker may win the race for a candidate; move on to the next one.
+    for candidate in pending.order_by('run_after', 'id').values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=candidate, status=Job.PENDING).update(
+            status=Job.RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=candidate)
+    return None
+
+
+def run(job):
+    """Call a claimed job's task and record the outcome. Returns True on success."""
+    if job is None:
+        return False
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= MAX_ATTEMPTS:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, finished_at=timezone.now(), last_error=error,
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, run_after=timezone.now() + RETRY_DELAY * job.attempts, last_error=error,
+            )
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now())
+    return True
+
+
+def requeue_stale(now=None):
+    """Hand out again jobs whose worker stopped without finishing them."""
+    now = now or timezone.now()
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=now - STALE_AFTER).update(
+        status=Job.PENDING, run_after=now,
+    )
+
+
+def prune(now=None):
+    """Delete finished jobs older than ``KEEP_FINISHED``; failed ones are kept."""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=now - KEEP_FINISHED).delete()
+    return deleted
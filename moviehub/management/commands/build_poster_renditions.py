@@ -0,0 +1,58 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moviehub.models import Movie
+from moviehub.posters import current_sizes, process_id, worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Make the resized JPEG/WebP renditions of existing movie posters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes resizing posters in parallel (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild renditions even for posters that already have them',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        movies = Movie.objects.exclude(poster='').exclude(poster__isnull=True).only('id', 'poster', 'poster_variants')
+        movie_ids = [m.id for m in movies.iterator() if options['force'] or not current_sizes(m)]
+        if not movie_ids:
+            self.stdout.write(self.style.SUCCESS('Every poster already has its renditions.'))
+            return
+
+        self.stdout.write(f'Making renditions for {len(movie_ids)} poster(s) with {workers} worker(s)...')
+        started = time.monotonic()
+        failed = []
+        if workers == 1:
+            results = map(process_id, movie_ids)
+        else:
+            pool = worker_pool(workers)
+            results = pool.map(process_id, movie_ids, chunksize=8)
+        try:
+            for movie_id, error in results:
+                if error:
+                    failed.append(movie_id)
+                    self.stderr.write(f'Movie {movie_id}: {error}')
+        finally:
+            if workers > 1:
+                pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        done = len(movie_ids) - len(failed)
+        self.stdout.write(self.style.SUCCESS(f'Made renditions for {done} poster(s) in {elapsed:.1f}s.'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{len(failed)} poster(s) could not be read; they keep their original.'))
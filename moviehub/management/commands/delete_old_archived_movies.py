@@ -1,11 +1,21 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import time
 from datetime import timedelta
-from moviehub.models import Movie
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.utils import timezone
+
+from moviehub import activity, jobs, versions
+from moviehub.models import Movie, Rating
+from moviehub.recommendations import refresh_after_ratings_removed
+
+# Ratings removed per statement. Popular movies have many, so they are
+# deleted in raw slices rather than collected by the ORM.
+RATING_CHUNK = 5000
 
 
 class Command(BaseCommand):
-    help = 'Automatically delete archived movies that are older than 30 days'
+    help = 'Delete archived movies older than the retention period, in batches (safe to re-run after an interruption)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -13,34 +23,114 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting',
         )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=30,
+            help='Delete movies archived more than this many days ago (default: 30)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Movies deleted per transaction (default: 100)',
+        )
+        parser.add_argument(
+            '--max-runtime',
+            type=float,
+            default=None,
+            help='Stop starting new batches after this many seconds; run again to continue',
+        )
 
     def handle(self, *args, **options):
         dry_run = options.get('dry_run', False)
-        
-        # Calculate the cutoff date (30 days ago)
-        cutoff_date = timezone.now() - timedelta(days=30)
-        
-        # Find archived movies older than 30 days
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['retention_days'] < 0:
+            raise CommandError('--retention-days cannot be negative')
+
+        cutoff_date = timezone.now() - timedelta(days=options['retention_days'])
         old_archived_movies = Movie.objects.filter(
             archived_at__isnull=False,
             archived_at__lt=cutoff_date
-        )
-        
+        ).order_by('id')
+
         count = old_archived_movies.count()
-        
         if count == 0:
             self.stdout.write(self.style.SUCCESS('No archived movies to delete.'))
             return
-        
+
         if dry_run:
-            self.stdout.write(self.style.WARNING(f'[DRY RUN] Would delete {count} archived movie(s):'))
-            for movie in old_archived_movies:
-                self.stdout.write(f"  - {movie.title} (archived: {movie.archived_at})")
-        else:
-            movies_to_delete = list(old_archived_movies.values_list('title', flat=True))
-            old_archived_movies.delete()
+            ratings = Rating.objects.filter(movie__in=old_archived_movies).count()
+            self.stdout.write(self.style.WARNING(
+                f'[DRY RUN] Would delete {count} archived movie(s) and their {ratings} rating(s):'
+            ))
+            for title, archived_at in old_archived_movies.values_list('title', 'archived_at').iterator():
+                self.stdout.write(f"  - {title} (archived: {archived_at})")
+            return
+
+        # Every batch commits on its own, so an interrupted run leaves only
+        # whole batches behind and the next run picks up the rest.
+        started = time.monotonic()
+        deleted_movies = deleted_ratings = 0
+        while True:
+            if options['max_runtime'] is not None and time.monotonic() - started >= options['max_runtime']:
+                remaining = old_archived_movies.count()
+                self.stdout.write(self.style.WARNING(
+                    f'Stopped after {options["max_runtime"]:g}s with {remaining} movie(s) left; run again to continue.'
+                ))
+                break
+            batch = list(old_archived_movies.values_list('id', 'title')[:batch_size])
+            if not batch:
+                break
+            movie_ids = [movie_id for movie_id, _ in batch]
+            deleted_ratings += self._delete_ratings(movie_ids)
+            with transaction.atomic():
+                # No ratings left to collect: this is the movies, their genre
+                # links and stored picks, and the usual catalog signals.
+                Movie.objects.filter(id__in=movie_ids).delete()
+            deleted_movies += len(batch)
+            if options['verbosity'] > 1:
+                for _, title in batch:
+                    self.stdout.write(f"  - {title}")
             self.stdout.write(
-                self.style.SUCCESS(f'Successfully deleted {count} archived movie(s):')
+                f'{deleted_movies}/{count} movie(s) and {deleted_ratings} rating(s) deleted '
+                f'({time.monotonic() - started:.1f}s)'
             )
-            for title in movies_to_delete:
-                self.stdout.write(f"  - {title}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully deleted {deleted_movies} archived movie(s) and {deleted_ratings} rating(s).'
+        ))
+
+    def _delete_ratings(self, movie_ids):
+        """Delete the ratings of ``movie_ids`` in raw slices; returns how many went.
+
+        A raw DELETE loads no instances and sends no per-row signals, so the
+        movie aggregates (about to go with the movies) are left alone and the
+        rest of what the Rating handlers keep in step is done here, once per
+        slice: the ratings version tokens, the raters' activity and rollup
+        days, and a re-rank job for the affected users, whose Top Picks
+        showing these movies are bumped by that job.
+        """
+        ratings = Rating.objects.filter(movie_id__in=movie_ids)
+        using = router.db_for_write(Rating)
+        total = 0
+        while True:
+            rows = list(ratings.order_by('id').values_list('id', 'user_id', 'movie_id', 'created_at')[:RATING_CHUNK])
+            if not rows:
+                return total
+            pairs = [[user_id, movie_id] for _, user_id, movie_id, _ in rows]
+            raters = {user_id for user_id, _ in pairs}
+            days = {activity.day_of(created_at) for *_, created_at in rows}
+            with transaction.atomic(using=using):
+                Rating.objects.filter(id__in=[row[0] for row in rows])._raw_delete(using)
+                # Queued in the same transaction, like the signal handlers do.
+                jobs.enqueue(refresh_after_ratings_removed, pairs=pairs)
+                transaction.on_commit(
+                    lambda r=raters: versions.bump_all(versions.RATINGS, *((versions.RATINGS, u) for u in r)),
+                    using=using,
+                )
+                transaction.on_commit(lambda r=raters: activity.touch_raters(r), using=using)
+                transaction.on_commit(lambda d=days: activity.rebuild_days(d), using=using)
+            total += len(rows)
@@ -0,0 +1,255 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from moviehub import tabular, versions
+from moviehub.facets import invalidate_facets
+from moviehub.models import CatalogEvent, Genre, Movie, parse_genres
+from moviehub.posters import delete_renditions, ingest_file, worker_pool
+
+
+def _clean(row):
+    """``(title, genre, release_year, description, poster)`` from an input row; raises ValueError."""
+    if not isinstance(row, dict):
+        raise ValueError('not an object')
+    title = str(row.get('title') or '').strip()
+    if not title:
+        raise ValueError('missing title')
+    if len(title) > Movie._meta.get_field('title').max_length:
+        raise ValueError('title too long')
+    try:
+        release_year = int(str(row.get('release_year') or '').strip())
+    except ValueError:
+        raise ValueError(f"bad release_year {row.get('release_year')!r}")
+    genre = ', '.join(parse_genres(str(row.get('genre') or '')))
+    if len(genre) > Movie._meta.get_field('genre').max_length:
+        raise ValueError('genre too long')
+    description = str(row.get('description') or '').strip()
+    poster = str(row.get('poster') or '').strip()
+    return title, genre, release_year, description, poster
+
+
+class Command(BaseCommand):
+    help = 'Import movies from a CSV or JSON Lines file, skipping ones already in the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON Lines file ('-' for standard input)")
+        parser.add_argument(
+            '--format',
+            choices=tabular.FORMATS,
+            help='Input format (default: from the file extension, csv for standard input)',
+        )
+        parser.add_argument(
+            '--posters',
+            metavar='DIR',
+            help="Directory holding the files named in the rows' poster column",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Movies inserted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes storing and resizing posters (default: one per CPU)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size, workers = options['batch_size'], options['workers']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        poster_dir = options['posters']
+        if poster_dir and not os.path.isdir(poster_dir):
+            raise CommandError(f'{poster_dir} is not a directory')
+
+        path = options['path']
+        fmt = tabular.guess_format(path, options['format'])
+
+        self.counts = dict(read=0, added=0, duplicates=0, invalid=0, posters=0, poster_errors=0)
+        self.genre_ids = {}
+        self.pool = None
+        self.pending = set()
+        self.stored = []
+        if poster_dir and workers > 1:
+            self.pool = worker_pool(workers)
+        self.workers = workers
+        # Every (title, release_year) in the catalog, read once: rows are
+        # checked against it instead of querying the unindexed title per chunk.
+        self.known = set(Movie.objects.values_list('title', 'release_year').iterator())
+
+        started = time.monotonic()
+        try:
+            with tabular.read_rows(path, fmt) as rows:
+                for chunk in tabular.batches(rows, batch_size):
+                    for movie_id, poster in self._import_chunk(chunk):
+                        if poster_dir:
+                            self._queue_poster(movie_id, os.path.join(poster_dir, poster))
+                    self._report(started)
+            self._drain(wait_all=True)
+        except tabular.READ_ERRORS as e:
+            raise CommandError(f'Could not read {path} near row {self.counts["read"] + 1}: {e}')
+        finally:
+            self._settle_posters()
+            # bulk_create and update() skip the Movie signal handlers. The
+            # search index follows on its own (database triggers / expression
+            # index); the cached facets and payloads are dropped here.
+            invalidate_facets()
+            versions.bump(versions.CATALOG)
+
+        elapsed = time.monotonic() - started
+        c = self.counts
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {c['added']} movie(s) in {elapsed:.1f}s "
+            f"({c['read'] / max(elapsed, 1e-6):.0f} rows/s); "
+            f"skipped {c['duplicates']} duplicate(s) and {c['invalid']} invalid row(s)."
+        ))
+        if poster_dir:
+            self.stdout.write(f"Stored {c['posters']} poster(s).")
+            if c['poster_errors']:
+                self.stdout.write(self.style.WARNING(f"{c['poster_errors']} poster(s) could not be stored or resized."))
+
+    def _import_chunk(self, chunk):
+        """Insert a chunk's new movies; returns ``[(movie_id, poster)]`` for those naming a poster."""
+        movies, posters = [], []
+        for row in chunk:
+            self.counts['read'] += 1
+            try:
+                title, genre, release_year, description, poster = _clean(row)
+            except ValueError as e:
+                self.counts['invalid'] += 1
+                self.stderr.write(f"Row {self.counts['read']}: {e}")
+                continue
+            # Covers duplicates within the file too: earlier rows are in ``known``.
+            if (title, release_year) in self.known:
+                self.counts['duplicates'] += 1
+                continue
+            self.known.add((title, release_year))
+            movies.append(Movie(title=title, genre=genre, release_year=release_year, description=description))
+            posters.append(poster)
+        if not movies:
+            return []
+
+        with transaction.atomic():
+            last_id = None
+            if not connection.features.can_return_rows_from_bulk_insert:
+                last_id = Movie.objects.aggregate(last=Max('id'))['last'] or 0
+            created = Movie.objects.bulk_create(movies)
+            if last_id is not None:
+                # Backends that can't return ids from a bulk insert: ours are past last_id.
+                ids = dict(
+                    ((title, year), pk) for pk, title, year in
+                    Movie.objects.filter(pk__gt=last_id).values_list('id', 'title', 'release_year')
+                )
+                for m in created:
+                    m.pk = ids[(m.title, m.release_year)]
+            self._link_genres(created)
+            # What the Movie post_save handlers would have journaled.
+            CatalogEvent.objects.bulk_create([CatalogEvent(movie_id=m.pk, kind=CatalogEvent.ADDED) for m in created])
+        self.counts['added'] += len(created)
+        invalidate_facets()
+        versions.bump(versions.CATALOG)
+        return [(m.pk, p) for m, p in zip(created, posters) if p]
+
+    def _link_genres(self, movies):
+        names = {}
+        for movie in movies:
+            for name in parse_genres(movie.genre):
+                names.setdefault(name.lower(), name)
+        missing = {slug: name for slug, name in names.items() if slug not in self.genre_ids}
+        if missing:
+            Genre.objects.bulk_create(
+                [Genre(slug=slug, name=name) for slug, name in missing.items()], ignore_conflicts=True,
+            )
+            self.genre_ids.update(Genre.objects.filter(slug__in=missing).values_list('slug', 'id'))
+        Through = Movie.genres.through
+        Through.objects.bulk_create(
+            [
+                Through(movie_id=movie.pk, genre_id=self.genre_ids[name.lower()])
+                for movie in movies for name in parse_genres(movie.genre)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _queue_poster(self, movie_id, path):
+        if self.pool is None:
+            self._stored(ingest_file(movie_id, path))
+            self._flush_posters(force=False)
+            return
+        self.pending.add(self.pool.submit(ingest_file, movie_id, path))
+        # Keep the queue short so memory stays flat however long the file is.
+        if len(self.pending) >= self.workers * 4:
+            self._drain()
+
+    def _drain(self, wait_all=False):
+        while self.pending:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._stored(future.result())
+            self._flush_posters(force=False)
+            if not wait_all and len(self.pending) < self.workers * 4:
+                break
+        self._flush_posters(force=wait_all)
+
+    def _stored(self, result):
+        movie_id, name, variants, error = result
+        if error:
+            self.counts['poster_errors'] += 1
+            self.stderr.write(f'Poster for movie {movie_id}: {error}')
+        if name:
+            self.stored.append(Movie(pk=movie_id, poster=name, poster_variants=variants))
+
+    def _flush_posters(self, force):
+        if not self.stored or (len(self.stored) < 100 and not force):
+            return
+        with transaction.atomic():
+            Movie.objects.bulk_update(self.stored, ['poster', 'poster_variants'])
+            # Dashboards that already showed these movies refetch their cards.
+            CatalogEvent.objects.bulk_create(
+                [CatalogEvent(movie_id=m.pk, kind=CatalogEvent.EDITED) for m in self.stored]
+            )
+        self.counts['posters'] += len(self.stored)
+        self.stored = []
+        versions.bump(versions.CATALOG)
+
+    def _settle_posters(self):
+        """Record the posters already stored, however the import ended.
+
+        After a failed batch the pool is stopped and the posters it finished
+        are still written to their (committed) movies. If even that fails, their
+        files are deleted rather than left behind in the storage.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            for future in self.pending:
+                if not future.cancelled() and future.exception() is None:
+                    self._stored(future.result())
+            self.pending = set()
+        try:
+            self._flush_posters(force=True)
+        except Exception:
+            storage = Movie._meta.get_field('poster').storage
+            for movie in self.stored:
+                delete_renditions(storage, movie.poster_variants)
+                storage.delete(movie.poster.name)
+            self.stored = []
+            raise
+
+    def _report(self, started):
+        elapsed = time.monotonic() - started
+        c = self.counts
+        line = (
+            f"{c['read']} rows read, {c['added']} added, {c['duplicates']} duplicate(s), "
+            f"{c['invalid']} invalid - {c['read'] / max(elapsed, 1e-6):.0f} rows/s"
+        )
+        if self.pool is not None or c['posters']:
+            line += f", {c['posters']} poster(s) stored"
+        self.stdout.write(line)
@@ -0,0 +1,185 @@
+import time
+from datetime import datetime, time as dt_time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from moviehub import activity, jobs, tabular, versions
+from moviehub.aggregates import recompute_rating_aggregates
+from moviehub.models import Movie, Rating
+from moviehub.recommendations import (
+    CooccurrenceEngine, bump_picks_showing, invalidate_engine, reload_engine, store_recommendations,
+)
+
+
+def _parse_created_at(value):
+    value = str(value or '').strip()
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'bad created_at {value!r}')
+        parsed = datetime.combine(day, dt_time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _clean(row):
+    """``(user, movie_id, value, created_at)`` from an input row; raises ValueError.
+
+    ``user`` is a username, or an int when the row has a ``user_id`` column instead.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('not an object')
+    if str(row.get('user_id') or '').strip():
+        user = int(row['user_id'])
+    else:
+        user = str(row.get('user') or '').strip()
+        if not user:
+            raise ValueError('missing user')
+    try:
+        movie_id = int(str(row.get('movie_id') or row.get('movie') or '').strip())
+        value = int(str(row.get('value') or '').strip())
+    except ValueError:
+        raise ValueError('movie and value must be integers')
+    if not 1 <= value <= 5:
+        raise ValueError(f'value {value} is not between 1 and 5')
+    return user, movie_id, value, _parse_created_at(row.get('created_at'))
+
+
+class Command(BaseCommand):
+    help = 'Import or update ratings from a CSV or JSON Lines file (user, movie, value, created_at)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="CSV or JSON Lines file ('-' for standard input). Columns: user (username) "
+                 "or user_id, movie (id), value (1-5), created_at (optional, ISO 8601)",
+        )
+        parser.add_argument(
+            '--format',
+            choices=tabular.FORMATS,
+            help='Input format (default: from the file extension, csv for standard input)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Ratings written per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--skip-recommendations',
+            action='store_true',
+            help="Don't rebuild stored recommendations afterwards (run rebuild_recommendations later)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        path = options['path']
+        fmt = tabular.guess_format(path, options['format'])
+
+        self.counts = dict(read=0, written=0, invalid=0, unknown=0)
+        self.raters = set()
+        self.movies = set()
+        started = time.monotonic()
+        try:
+            with tabular.read_rows(path, fmt) as rows:
+                for chunk in tabular.batches(rows, batch_size):
+                    self._import_chunk(chunk)
+                    elapsed = time.monotonic() - started
+                    c = self.counts
+                    self.stdout.write(
+                        f"{c['read']} rows read, {c['written']} written, {c['unknown']} unknown user/movie, "
+                        f"{c['invalid']} invalid - {c['read'] / max(elapsed, 1e-6):.0f} rows/s"
+                    )
+        except tabular.READ_ERRORS as e:
+            raise CommandError(f'Could not read {path} near row {self.counts["read"] + 1}: {e}')
+        finally:
+            if self.counts['written']:
+                self._rebuild_derived(options['skip_recommendations'])
+
+        c = self.counts
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {c['written']} rating(s) in {time.monotonic() - started:.1f}s; skipped "
+            f"{c['unknown']} for unknown users or movies and {c['invalid']} invalid row(s)."
+        ))
+
+    def _import_chunk(self, chunk):
+        cleaned = []
+        for row in chunk:
+            self.counts['read'] += 1
+            try:
+                cleaned.append(_clean(row))
+            except (TypeError, ValueError) as e:
+                self.counts['invalid'] += 1
+                self.stderr.write(f"Row {self.counts['read']}: {e}")
+        if not cleaned:
+            return
+
+        names = {user for user, *_ in cleaned if isinstance(user, str)}
+        user_ids = dict(User.objects.filter(username__in=names).values_list('username', 'id'))
+        known_ids = {user for user, *_ in cleaned if isinstance(user, int)}
+        user_ids.update((i, i) for i in User.objects.filter(id__in=known_ids).values_list('id', flat=True))
+        movie_ids = set(Movie.objects.filter(id__in={m for _, m, *_ in cleaned}).values_list('id', flat=True))
+
+        # One row per (user, movie), the last one in the file winning: an
+        # upsert may not touch the same row twice in one statement.
+        ratings = {}
+        for user, movie_id, value, created_at in cleaned:
+            user_id = user_ids.get(user)
+            if user_id is None or movie_id not in movie_ids:
+                self.counts['unknown'] += 1
+                continue
+            ratings[(user_id, movie_id)] = (value, created_at)
+
+        # created_at is auto_now_add, so the upsert stamps new rows with the
+        # import time and leaves existing ones alone; the timestamps the file
+        # does give are then written over both in a second pass.
+        dated = {pair: c for pair, (_, c) in ratings.items() if c is not None}
+        with transaction.atomic():
+            Rating.objects.bulk_create(
+                [Rating(user_id=u, movie_id=m, value=v) for (u, m), (v, _) in ratings.items()],
+                update_conflicts=True, unique_fields=['user', 'movie'], update_fields=['value'],
+            )
+            if dated:
+                rows = Rating.objects.filter(
+                    user_id__in={u for u, _ in dated}, movie_id__in={m for _, m in dated},
+                ).values_list('id', 'user_id', 'movie_id')
+                Rating.objects.bulk_update(
+                    [Rating(id=pk, created_at=dated[(u, m)]) for pk, u, m in rows if (u, m) in dated],
+                    ['created_at'], batch_size=1000,
+                )
+        self.counts['written'] += len(ratings)
+        self.raters.update(u for u, _ in ratings)
+        self.movies.update(m for _, m in ratings)
+
+    def _rebuild_derived(self, skip_recommendations):
+        # bulk_create skips the Rating signal handlers, so everything they
+        # keep in step is rebuilt here, each in one pass.
+        self.stdout.write('Rebuilding rating aggregates and activity rollups...')
+        recompute_rating_aggregates()
+        activity.rebuild()
+        activity.touch_raters(self.raters)
+        versions.bump_all(versions.RATINGS, *((versions.RATINGS, user_id) for user_id in self.raters))
+        # Tells the engines of running processes (the worker's too) to rebuild.
+        jobs.enqueue(reload_engine)
+        if skip_recommendations:
+            # The picks stay as they are, but the averages they show moved.
+            bump_picks_showing(self.movies)
+            self.stdout.write(self.style.WARNING(
+                'Stored recommendations are out of date; run `manage.py rebuild_recommendations`.'
+            ))
+            return
+        self.stdout.write('Rebuilding recommendations...')
+        # New co-occurrences can move anyone's picks, not only the importers'.
+        count = store_recommendations(engine=CooccurrenceEngine.from_db())
+        invalidate_engine()
+        self.stdout.write(f'Rebuilt recommendations for {count} user(s).')
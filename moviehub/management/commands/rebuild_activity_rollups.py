@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from moviehub.activity import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the DailyActivity rollup from the Rating and User tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            metavar='YYYY-MM-DD',
+            help='Only rebuild days from this date onwards (default: all history)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options.get('since'):
+            try:
+                since = parse_date(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        days = rebuild(since=since)
+        scope = f'since {since.isoformat()}' if since else 'for all history'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {days} day(s) of activity {scope}.'))
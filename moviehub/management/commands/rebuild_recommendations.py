@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from moviehub.recommendations import CooccurrenceEngine, store_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed per-user recommendation table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            nargs='+',
+            metavar='USER',
+            help='Only rebuild these users (usernames or ids)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users scored and written per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        user_ids = None
+        if options.get('users'):
+            ids = [u for u in options['users'] if u.isdigit()]
+            names = [u for u in options['users'] if not u.isdigit()]
+            user_ids = list(
+                User.objects.filter(Q(id__in=ids) | Q(username__in=names))
+                .order_by('id').values_list('id', flat=True)
+            )
+            if not user_ids:
+                raise CommandError('No matching users found.')
+
+        # Always score from a fresh snapshot rather than a worker's cached engine.
+        engine = CooccurrenceEngine.from_db()
+        count = store_recommendations(user_ids, batch_size=batch_size, engine=engine)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recommendations for {count} user(s).'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from moviehub.aggregates import drifted_movies, recompute_rating_aggregates
+
+SHOW_LIMIT = 20
+
+
+class Command(BaseCommand):
+    help = 'Recompute Movie.rating_sum / rating_count from the Rating table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report movies whose aggregates have drifted without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        drifted = drifted_movies()
+        count = drifted.count()
+
+        if count == 0:
+            self.stdout.write(self.style.SUCCESS('Rating aggregates are consistent.'))
+            return
+
+        sample = drifted.order_by('id').values_list(
+            'id', 'title', 'rating_sum', 'rating_count', 'actual_sum', 'actual_count'
+        )[:SHOW_LIMIT]
+        for movie_id, title, stored_sum, stored_count, actual_sum, actual_count in sample:
+            self.stdout.write(
+                f"  - {title} (id {movie_id}): sum {stored_sum} -> {actual_sum}, count {stored_count} -> {actual_count}"
+            )
+        if count > SHOW_LIMIT:
+            self.stdout.write(f"  ... and {count - SHOW_LIMIT} more")
+
+        if options.get('dry_run'):
+            self.stdout.write(self.style.WARNING(f'[DRY RUN] {count} movie(s) have drifted aggregates.'))
+            return
+
+        # One UPDATE over the whole catalog is cheaper than filtering to the drifted rows.
+        recompute_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Repaired rating aggregates for {count} movie(s).'))
@@ -0,0 +1,67 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from moviehub import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (poster uploads and renditions, recommendation refreshes, ...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due now, then exit',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before checking again when the queue is empty (default: 1)',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=None,
+            help='Exit after this many jobs (default: run until stopped)',
+        )
+
+    def handle(self, *args, **options):
+        if options['sleep'] <= 0:
+            raise CommandError('--sleep must be positive')
+        self.stopping = False
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._stop)
+
+        done = failed = 0
+        last_housekeeping = 0.0
+        while not self.stopping:
+            if time.monotonic() - last_housekeeping > 60:
+                jobs.requeue_stale()
+                jobs.prune()
+                last_housekeeping = time.monotonic()
+
+            job = jobs.claim()
+            if job is None:
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['sleep'])
+                continue
+
+            if jobs.run(job):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f'Job {job.id} ({job.task}) failed on attempt {job.attempts}.')
+            if options['max_jobs'] and done + failed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped: {done} job(s) done, {failed} failed.'))
+
+    def _stop(self, signum, frame):
+        # Finish the current job, then exit.
+        self.stopping = True
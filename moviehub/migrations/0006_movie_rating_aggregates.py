@@ -0,0 +1,42 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('moviehub', 'Movie')
+    Rating = apps.get_model('moviehub', 'Rating')
+    per_movie = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    Movie.objects.update(
+        rating_sum=Coalesce(
+            Subquery(per_movie.annotate(total=Sum('value')).values('total'), output_field=IntegerField()),
+            Value(0),
+        ),
+        rating_count=Coalesce(
+            Subquery(per_movie.annotate(total=Count('id')).values('total'), output_field=IntegerField()),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0005_userrecommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def populate_genres(apps, schema_editor):
+    """Parse every Movie.genre string into Genre rows and M2M links."""
+    Genre = apps.get_model('moviehub', 'Genre')
+    Movie = apps.get_model('moviehub', 'Movie')
+    Through = Movie.genres.through
+
+    genre_ids = {}
+    links = []
+    for movie_id, value in Movie.objects.values_list('id', 'genre').iterator():
+        seen = set()
+        for part in (value or '').split(','):
+            name = part.strip().replace('-', '')
+            slug = name.lower()
+            if not name or slug in seen:
+                continue
+            seen.add(slug)
+            if slug not in genre_ids:
+                genre_ids[slug] = Genre.objects.get_or_create(slug=slug, defaults={'name': name})[0].id
+            links.append(Through(movie_id=movie_id, genre_id=genre_ids[slug]))
+    Through.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0007_genre'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_genres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+"""Full-text index over Movie title/genre/description (see moviehub.search).
+
+SQLite gets an external-content FTS5 table kept in sync by triggers;
+PostgreSQL gets a GIN index on the weighted tsvector expression used by
+moviehub.search.PostgresFTSBackend. Other backends get nothing and fall back
+to substring matching.
+"""
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS moviehub_movie_fts USING fts5(
+        title, genre, description, content='moviehub_movie', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS moviehub_movie_fts_ai AFTER INSERT ON moviehub_movie BEGIN
+        INSERT INTO moviehub_movie_fts(rowid, title, genre, description)
+        VALUES (new.id, new.title, new.genre, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS moviehub_movie_fts_ad AFTER DELETE ON moviehub_movie BEGIN
+        INSERT INTO moviehub_movie_fts(moviehub_movie_fts, rowid, title, genre, description)
+        VALUES ('delete', old.id, old.title, old.genre, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS moviehub_movie_fts_au
+        AFTER UPDATE OF title, genre, description ON moviehub_movie BEGIN
+        INSERT INTO moviehub_movie_fts(moviehub_movie_fts, rowid, title, genre, description)
+        VALUES ('delete', old.id, old.title, old.genre, old.description);
+        INSERT INTO moviehub_movie_fts(rowid, title, genre, description)
+        VALUES (new.id, new.title, new.genre, new.description);
+    END""",
+    "INSERT INTO moviehub_movie_fts(moviehub_movie_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS moviehub_movie_fts_au',
+    'DROP TRIGGER IF EXISTS moviehub_movie_fts_ad',
+    'DROP TRIGGER IF EXISTS moviehub_movie_fts_ai',
+    'DROP TABLE IF EXISTS moviehub_movie_fts',
+]
+
+POSTGRES_FORWARD = [
+    """CREATE INDEX IF NOT EXISTS moviehub_movie_search_idx ON moviehub_movie USING GIN ((
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(genre, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ))""",
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS moviehub_movie_search_idx',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0008_populate_genres'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
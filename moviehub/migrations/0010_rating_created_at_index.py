@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0009_movie_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['created_at', 'user'], name='moviehub_ra_created_03c40e_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:54
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_activity(apps, schema_editor):
+    DailyActivity = apps.get_model('moviehub', 'DailyActivity')
+    Rating = apps.get_model('moviehub', 'Rating')
+    User = apps.get_model('auth', 'User')
+    totals = {}
+    rating_rows = (
+        Rating.objects.filter(created_at__isnull=False)
+        .annotate(day=TruncDate('created_at')).values('day')
+        .annotate(ratings=Count('id'), raters=Count('user', distinct=True))
+        .order_by().values_list('day', 'ratings', 'raters')
+    )
+    for day, ratings, raters in rating_rows:
+        totals.setdefault(day, {'new_users': 0}).update(ratings=ratings, raters=raters)
+    user_rows = (
+        User.objects.annotate(day=TruncDate('date_joined')).values('day')
+        .annotate(new_users=Count('id'))
+        .order_by().values_list('day', 'new_users')
+    )
+    for day, new_users in user_rows:
+        totals.setdefault(day, {'ratings': 0, 'raters': 0})['new_users'] = new_users
+    DailyActivity.objects.bulk_create(
+        [DailyActivity(day=day, **values) for day, values in sorted(totals.items())]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0010_rating_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('ratings', models.PositiveIntegerField(default=0)),
+                ('raters', models.PositiveIntegerField(default=0)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily activity',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.RunPython(backfill_daily_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:56
+
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+# A frozen copy of the moviehub.sketches encoding as of this migration, so
+# later changes to that module cannot alter what the backfill writes.
+BITSET, HLL = 0, 1
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+BITSET_MAX_ID = HLL_REGISTERS * 8
+
+
+def _hll_registers(ids):
+    registers = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    with np.errstate(over='ignore'):
+        z = ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        hashes = z ^ (z >> np.uint64(31))
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes << np.uint64(HLL_PRECISION)
+    zeros = np.zeros(len(rest), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_clear = rest < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[top_clear] += shift
+        rest[top_clear] <<= np.uint64(shift)
+    zeros[rest == 0] = 64
+    ranks = np.minimum(zeros + 1, 64 - HLL_PRECISION + 1).astype(np.uint8)
+    np.maximum.at(registers, index, ranks)
+    return registers
+
+
+def _sketch_bytes(user_ids):
+    ids = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+    if not len(ids):
+        return bytes([BITSET])
+    if ids[-1] < BITSET_MAX_ID:
+        bits = np.zeros((int(ids[-1]) // 8 + 1) * 8, dtype=np.uint8)
+        bits[ids] = 1
+        return bytes([BITSET]) + np.packbits(bits, bitorder='little').tobytes()
+    return bytes([HLL]) + _hll_registers(ids).tobytes()
+
+
+def backfill_raters_sketch(apps, schema_editor):
+    DailyActivity = apps.get_model('moviehub', 'DailyActivity')
+    Rating = apps.get_model('moviehub', 'Rating')
+    rows = (
+        Rating.objects.filter(created_at__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values_list('day', 'user_id').distinct().order_by('day')
+    )
+    for day, user_ids in groupby(rows.iterator(), key=itemgetter(0)):
+        raw = _sketch_bytes(u for _, u in user_ids)
+        DailyActivity.objects.filter(day=day).update(raters_sketch=raw)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0011_dailyactivity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='raters_sketch',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(backfill_raters_sketch, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.26 on 2026-10-18 09:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0013_userprofile_ratings_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_id', models.BigIntegerField(db_index=True)),
+                ('kind', models.CharField(choices=[('added', 'Added'), ('edited', 'Edited'), ('archived', 'Archived'), ('restored', 'Restored'), ('deleted', 'Deleted')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 09:10
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# On SQLite, adding (or removing) a column rebuilds the movie table, which
+# drops the full-text triggers created by 0009. Re-create them after the
+# rebuild in either direction; the statements are IF NOT EXISTS and end with
+# a full index rebuild, and do nothing on other databases.
+search_index = import_module('moviehub.migrations.0009_movie_search_index')
+restore_search_triggers = search_index._run({'sqlite': search_index.SQLITE_FORWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviehub', '0014_catalogevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='movie',
+            name='poster_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,86 @@
-from django.db import models
 from django.contrib.auth.models import User
+from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent with `instance` after Movie.archive() / Movie.restore() persist the change.
+movie_archived = Signal()
+movie_restored = Signal()
+
 
 # User Profile model
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(blank=True, null=True)
+    # Last time one of the user's ratings was added or removed (admin users poll)
+    ratings_changed_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+def parse_genres(value):
+    """Split a comma-separated genre string into normalized, de-duplicated names."""
+    names = []
+    seen = set()
+    for part in (value or '').split(','):
+        name = part.strip().replace('-', '')
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+# Genre model, normalized out of Movie.genre
+class Genre(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    # Lower-cased name so filters can do an indexed, case-insensitive match
+    slug = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 # Movie model
 class Movie(models.Model):
     title = models.CharField(max_length=200)
     genre = models.CharField(max_length=100)
+    # Kept in sync with `genre` on save; use this for filtering and facets.
+    genres = models.ManyToManyField(Genre, related_name='movies', blank=True, editable=False)
     release_year = models.IntegerField()
     description = models.TextField()
     poster = models.ImageField(upload_to='posters/', blank=True, null=True)
+    # Resized copies of `poster` written by moviehub.posters (see `process`).
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
     archived_at = models.DateTimeField(null=True, blank=True, help_text="When the movie was archived. Null if not archived.")
+    # Denormalized rating aggregates, kept in step by the Rating signal handlers.
+    # `manage.py recompute_rating_aggregates` repairs any drift.
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
 
     def average_rating(self):
-        try:
-            ratings = self.ratings.all()
-            if ratings.exists():
-                return round(sum(r.value for r in ratings) / ratings.count(), 1)
-            return 0
-        except Exception:
-            # If the ratings table/columns aren't available (migrations not applied),
-            # avoid crashing the site — return 0 as a safe fallback.
-            return 0
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
+        return 0
+
+    def sync_genres(self):
+        genres = [
+            Genre.objects.get_or_create(slug=name.lower(), defaults={'name': name})[0]
+            for name in parse_genres(self.genre)
+        ]
+        self.genres.set(genres)
+
+    def archive(self):
+        self.archived_at = timezone.now()
+        self.save(update_fields=['archived_at'])
+        movie_archived.send(sender=Movie, instance=self)
+
+    def restore(self):
+        self.archived_at = None
+        self.save(update_fields=['archived_at'])
+        movie_restored.send(sender=Movie, instance=self)
 
     def __str__(self):
         return self.title
@@ -41,6 +94,115 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('user', 'movie')
+        # Serves created_at range scans (activity stats) without touching the table.
+        indexes = [models.Index(fields=['created_at', 'user'])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so updates can adjust Movie aggregates by the delta.
+        instance._loaded_value = instance.__dict__.get('value')
+        return instance
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.movie.title}: {self.value}"
+
+# Precomputed recommendations, rebuilt by `manage.py rebuild_recommendations`
+class UserRecommendation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'movie')
+        indexes = [models.Index(fields=['user', 'rank'])]
+
+    def __str__(self):
+        return f"{self.user_id} #{self.rank}: {self.movie_id}"
+
+# Per-day activity totals, kept in step by signals and rebuilt by
+# `manage.py rebuild_activity_rollups`
+class DailyActivity(models.Model):
+    day = models.DateField(unique=True)
+    ratings = models.PositiveIntegerField(default=0)
+    raters = models.PositiveIntegerField(default=0)
+    new_users = models.PositiveIntegerField(default=0)
+    # Serialized moviehub.sketches.UserSketch of the day's raters
+    raters_sketch = models.BinaryField(default=b'', editable=False)
+
+    class Meta:
+        ordering = ['day']
+        verbose_name_plural = 'daily activity'
+
+    def __str__(self):
+        return f"{self.day}: {self.ratings} ratings by {self.raters} users, {self.new_users} new"
+
+# Append-only journal of catalog changes; clients poll it by `seq` (the id)
+class CatalogEvent(models.Model):
+    ADDED = 'added'
+    EDITED = 'edited'
+    ARCHIVED = 'archived'
+    RESTORED = 'restored'
+    DELETED = 'deleted'
+    KIND_CHOICES = [
+        (ADDED, 'Added'),
+        (EDITED, 'Edited'),
+        (ARCHIVED, 'Archived'),
+        (RESTORED, 'Restored'),
+        (DELETED, 'Deleted'),
+    ]
+
+    # Not a ForeignKey: events must outlive permanently deleted movies.
+    movie_id = models.BigIntegerField(db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} movie {self.movie_id}"
+
+# Background work queued by moviehub.jobs and run by `manage.py run_worker`
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Dotted path of the function to call with `kwargs`.
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        # Serves the worker's "next pending job that is due" lookup.
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"#{self.id} {self.task} ({self.status})"
+
+# An admin poster upload waiting for its `store_upload` job (moviehub.posters).
+# Kept in the database, which the web service and the worker both reach.
+class StagedUpload(models.Model):
+    name = models.CharField(max_length=255)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username} -> {self.movie.title}: {self.value}"
\ No newline at end of file
+        return f"#{self.id} {self.name} ({len(self.data or b'')} bytes)"
@@ -0,0 +1,92 @@
+"""Keyset (cursor) pagination for the movie grid and the admin tables.
+
+Pages are ordered newest first and the cursor identifies the last row of the
+previous page, so each page is an indexed range scan with a LIMIT no matter
+how deep the reader has scrolled:
+
+- the movie grid pages on ``id`` alone (``movie_page``)
+- admin tables page on a timestamp with ``id`` as the tie-breaker
+  (``timestamp_page``); the cursor is ``"<microseconds>:<id>"``
+"""
+import datetime
+
+from django.db.models import F, Q
+
+MOVIE_PAGE_SIZE = 24
+ADMIN_PAGE_SIZE = 50
+MAX_ADMIN_PAGE_SIZE = 500
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def movie_page(queryset, cursor=None, page_size=MOVIE_PAGE_SIZE):
+    """Return ``(movies, next_cursor)``; ``next_cursor`` is None on the last page."""
+    if cursor:
+        queryset = queryset.filter(id__lt=cursor)
+    # Fetch one extra row to learn whether another page exists.
+    movies = list(queryset.order_by('-id')[:page_size + 1])
+    if len(movies) > page_size:
+        movies = movies[:page_size]
+        return movies, movies[-1].id
+    return movies, None
+
+
+def parse_page_size(value, default=ADMIN_PAGE_SIZE, maximum=MAX_ADMIN_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _encode_timestamp_cursor(moment, pk):
+    if moment is None:
+        # Rows without a timestamp sort last; page through them by id.
+        return f'-:{pk}'
+    return f'{(moment - _EPOCH) // _MICROSECOND}:{pk}'
+
+
+def parse_timestamp_cursor(value):
+    """Decode a ``timestamp_page`` cursor into ``(datetime or None, id)``."""
+    try:
+        micros, pk = str(value).split(':')
+        moment = None if micros == '-' else _EPOCH + int(micros) * _MICROSECOND
+        return moment, int(pk)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def timestamp_page(queryset, field, cursor=None, page_size=ADMIN_PAGE_SIZE):
+    """Page ``queryset`` newest ``field`` first; returns ``(rows, next_cursor)``.
+
+    Works for model instances and for ``values()`` dicts (which must include
+    ``field`` and ``id``).
+    """
+    after = parse_timestamp_cursor(cursor) if cursor else None
+    if after:
+        moment, pk = after
+        if moment is None:
+            queryset = queryset.filter(**{f'{field}__isnull': True, 'id__lt': pk})
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': moment})
+                | Q(**{field: moment, 'id__lt': pk})
+                | Q(**{f'{field}__isnull': True})
+            )
+    rows = list(queryset.order_by(F(field).desc(nulls_last=True), '-id')[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            return rows, _encode_timestamp_cursor(last[field], last['id'])
+        return rows, _encode_timestamp_cursor(getattr(last, field), last.id)
+    return rows, None
@@ -0,0 +1,221 @@
+"""Fixed-width poster renditions for cards and tables.
+
+Uploaded posters are kept as they are. ``process`` writes a JPEG and a WebP
+copy at each of ``WIDTHS`` (capped at the original's width) next to it, through
+the poster field's storage backend, and records their names on
+``Movie.poster_variants``:
+
+    {"source": "posters/x.png",
+     "sizes": {"160": {"jpeg": "posters/x-160w.jpg", "webp": "posters/x-160w.webp"}, ...}}
+
+``source`` is the poster they were made from, so renditions of a replaced
+poster are never served. ``rendition_name`` is only the preferred name: the
+storage picks a free one when it is taken (another movie's poster with the
+same stem, or an earlier rendition of this one), so renditions are never
+overwritten, and only the names a movie has recorded are ever deleted.
+
+Uploads from the admin don't wait for any of this: ``stage_upload`` keeps the
+uploaded bytes in a ``StagedUpload`` row, in the database the web and worker
+services share, and queues ``store_upload``. The request never talks to the
+poster storage, which may be a remote media service. A worker runs the job to
+store the file under its final name, make the renditions and save the movie,
+whose signals then journal the edit and invalidate cached payloads.
+
+Templates use the ``poster_picture`` / ``poster_srcset`` tags
+(``moviehub.templatetags.posters``), which fall back to the original until
+renditions exist. ``manage.py build_poster_renditions`` backfills existing
+posters, and ``manage.py import_movies`` stores the posters of imported movies
+through ``ingest_file``.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from . import jobs, versions
+from .models import Movie, StagedUpload
+
+WIDTHS = (160, 320, 640)
+
+# format -> (file extension, Pillow save options)
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+logger = logging.getLogger(__name__)
+
+# Dashboard cards are 220px wide (see .movie-card in style.css).
+DEFAULT_SIZES = '220px'
+
+
+def rendition_name(source, width, fmt):
+    stem, _ = os.path.splitext(source)
+    return f'{stem}-{width}w.{FORMATS[fmt][0]}'
+
+
+def current_sizes(movie):
+    """``{width: {format: name}}`` for the movie's current poster ({} if none yet)."""
+    variants = movie.poster_variants or {}
+    if not movie.poster or variants.get('source') != movie.poster.name:
+        return {}
+    return {int(width): names for width, names in variants.get('sizes', {}).items()}
+
+
+def srcset(movie, fmt='jpeg'):
+    """``srcset`` value listing the poster's ``fmt`` renditions ('' until they exist)."""
+    try:
+        storage = movie.poster.storage
+        return ', '.join(
+            f'{storage.url(names[fmt])} {width}w'
+            for width, names in sorted(current_sizes(movie).items())
+            if fmt in names
+        )
+    except Exception:
+        return ''
+
+
+def _load(storage, source):
+    with storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Flatten transparency onto white; JPEG has no alpha channel.
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save(storage, name, image, fmt):
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **FORMATS[fmt][1])
+    # May come back under another name if ``name`` is taken.
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render(storage, source):
+    """Write every rendition of ``source`` and return the ``poster_variants`` value."""
+    image = _load(storage, source)
+    # Never upscale: a narrow original tops the list at its own width.
+    widths = sorted({min(w, image.width) for w in WIDTHS})
+    sizes = {}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        sizes[str(width)] = {fmt: _save(storage, rendition_name(source, width, fmt), resized, fmt) for fmt in FORMATS}
+    return {'source': source, 'sizes': sizes}
+
+
+def _names(variants):
+    return {name for names in (variants or {}).get('sizes', {}).values() for name in names.values()}
+
+
+def delete_renditions(storage, variants, keep=None):
+    """Delete the files recorded in ``variants`` except those also in ``keep``."""
+    for name in _names(variants) - _names(keep):
+        try:
+            storage.delete(name)
+        except Exception:
+            pass
+
+
+def process(movie):
+    """Make renditions of ``movie``'s poster and record them; drop the old ones.
+
+    Raises if the poster cannot be read as an image; the movie keeps serving
+    its original poster in that case.
+    """
+    storage = movie.poster.storage
+    old = movie.poster_variants or {}
+    variants = render(storage, movie.poster.name) if movie.poster else {}
+    # update(), not save(): renditions are not a catalog edit.
+    Movie.objects.filter(pk=movie.pk).update(poster_variants=variants)
+    movie.poster_variants = variants
+    delete_renditions(storage, old, keep=variants)
+    # Cached card payloads (e.g. Top Picks) should pick up the new srcset.
+    versions.bump(versions.CATALOG)
+    return variants
+
+
+def _init_worker():
+    # Spawned workers (Windows, macOS) start without Django configured.
+    django.setup()
+
+
+def worker_pool(workers):
+    """A process pool for ``process_id`` / ``ingest_file``."""
+    # Workers open their own connections; don't hand them ours.
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def process_id(movie_id):
+    """``process`` by id, for worker processes. Returns ``(movie_id, error or None)``."""
+    try:
+        movie = Movie.objects.get(pk=movie_id)
+        process(movie)
+    except Exception as e:
+        return movie_id, str(e) or e.__class__.__name__
+    return movie_id, None
+
+
+def stage_upload(movie, upload):
+    """Stage ``upload`` and queue ``store_upload`` for it; returns the Job."""
+    staged = StagedUpload.objects.create(name=os.path.basename(upload.name), data=upload.read())
+    return jobs.enqueue(store_upload, movie_id=movie.id, staged_id=staged.id)
+
+
+def store_upload(movie_id, staged_id):
+    """Job: make a staged upload the movie's poster, with its renditions."""
+    staged = StagedUpload.objects.filter(pk=staged_id).first()
+    if staged is None:
+        # Already stored by an earlier attempt.
+        return
+    movie = Movie.objects.filter(pk=movie_id).first()
+    if movie is None:
+        # Deleted while the job waited.
+        staged.delete()
+        return
+    old = movie.poster_variants or {}
+    movie.poster.save(staged.name, ContentFile(bytes(staged.data)), save=False)
+    try:
+        movie.poster_variants = render(movie.poster.storage, movie.poster.name)
+    except Exception as e:
+        # Not an image Pillow can read: keep serving the original upload.
+        logger.warning('Could not make poster renditions for movie %s: %s', movie.id, e)
+        movie.poster_variants = {}
+    with transaction.atomic():
+        # A regular save, so the signal handlers journal the edit (dashboards
+        # update the card) and invalidate the catalog's cached payloads.
+        movie.save(update_fields=['poster', 'poster_variants'])
+        staged.delete()
+    delete_renditions(movie.poster.storage, old, keep=movie.poster_variants)
+
+
+def ingest_file(movie_id, path):
+    """Store the local file ``path`` as a poster and render it, without touching the database.
+
+    For worker processes: returns ``(movie_id, name, variants, error or None)``
+    and leaves recording ``name`` / ``variants`` on the movie to the caller.
+    """
+    field = Movie._meta.get_field('poster')
+    try:
+        with open(path, 'rb') as f:
+            name = field.storage.save(field.generate_filename(None, os.path.basename(path)), File(f))
+    except Exception as e:
+        return movie_id, None, {}, str(e) or e.__class__.__name__
+    try:
+        variants = render(field.storage, name)
+    except Exception as e:
+        # Keep the original, as for uploads through the admin.
+        return movie_id, name, {}, str(e) or e.__class__.__name__
+    return movie_id, name, variants, None
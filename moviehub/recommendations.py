@@ -1,16 +1,502 @@
-from collections import Counter
-from .models import Rating
+"""Item-item co-occurrence recommendations.
 
-def get_recommendations(user):
-    user_ratings = Rating.objects.filter(user=user, value__gte=4)
-    movie_ids = [r.movie.id for r in user_ratings]
+A movie is recommended to a user when people who rated something the user
+liked (4+ stars) also liked that movie. The score of a candidate is the number
+of such distinct "similar" users, exactly as the original Counter-based
+implementation computed it, but everything is done on integer ids held in
+memory instead of re-reading Rating rows (and their lazy FKs) per request.
 
-    similar_users = Rating.objects.filter(movie__id__in=movie_ids).exclude(user=user)
-    similar_users_ids = [r.user.id for r in similar_users]
+Stored picks (``UserRecommendation``) are refreshed off-request: the signal
+handlers queue ``refresh_after_rating`` and friends as jobs (``moviehub.jobs``).
+Every write the engine cares about therefore leaves a Job row, and those ids
+are monotonic. Each process keeps its own engine together with the highest
+job id it reflects (``high_water``). Before storing anything, a job reads the
+engine jobs past that mark, which are writes handled elsewhere or not yet
+handled. It re-reads just the ratings and movies they name and applies them.
+A stale engine never overwrites fresher rankings. Bulk writers that bypass the
+signals queue ``reload_engine``, which makes every engine rebuild. A job
+re-ranks at most ``REFRESH_USERS_PER_JOB`` users and queues the rest.
+"""
+import threading
+import time
 
-    recommended_movies = Rating.objects.filter(user__id__in=similar_users_ids, value__gte=4) \
-                                        .exclude(movie__id__in=movie_ids)
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
 
-    movie_counter = Counter([r.movie for r in recommended_movies if getattr(r.movie, 'archived_at', None) is None])
-    top_movies = [movie for movie, _ in movie_counter.most_common(5)]
-    return top_movies
\ No newline at end of file
+from . import jobs, versions
+from .jobs import task_path
+from .models import Job, Movie, Rating, UserRecommendation
+
+LIKE_THRESHOLD = 4
+TOP_N = 5
+# Keep a few spare picks per user so archiving one still leaves TOP_N to show.
+STORED_PER_USER = 20
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+# Users scored together by ``score_many``, and the most matrix cells one such
+# batch may allocate before it is split further.
+SCORE_BATCH = 256
+MAX_DENSE_CELLS = 20_000_000
+
+# Users one refresh job re-ranks; the rest of an affected set is queued.
+REFRESH_USERS_PER_JOB = 500
+
+# Missed engine jobs applied one by one; past this a rebuild is cheaper.
+CATCH_UP_LIMIT = 5000
+
+
+def _group(keys, values):
+    """Group ``values`` by ``keys`` into a dict of sorted, de-duplicated arrays."""
+    if not len(keys):
+        return {}
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    return {
+        int(key): np.unique(chunk)
+        for key, chunk in zip(keys[starts], np.split(values, boundaries))
+    }
+
+
+def _indicator(rows, columns):
+    """0/1 matrix marking, for each array in ``rows``, which of ``columns`` (sorted) it holds."""
+    matrix = np.zeros((len(rows), len(columns)), dtype=np.float32)
+    lengths = [len(row) for row in rows]
+    if not len(columns) or not sum(lengths):
+        return matrix
+    values = np.concatenate(rows)
+    row_index = np.repeat(np.arange(len(rows)), lengths)
+    pos = np.minimum(np.searchsorted(columns, values), len(columns) - 1)
+    found = columns[pos] == values
+    matrix[row_index[found], pos[found]] = 1
+    return matrix
+
+
+class CooccurrenceEngine:
+    """Sparse item-item co-occurrence index built from rating ids only.
+
+    The co-occurrence between a seed movie and a candidate is the set of users
+    who rated the seed and liked the candidate. Rather than materialising the
+    full item x item matrix, the engine keeps its two sparse factors and joins
+    them at scoring time with vectorized NumPy set operations:
+
+    - ``item_raters``: movie id -> users who rated it (any value)
+    - ``user_likes``: user id -> movies the user rated ``LIKE_THRESHOLD`` or more
+    - ``user_seen``: user id -> every movie the user has rated
+    - ``item_likers``: movie id -> users who liked it (the transpose of
+      ``user_likes``, used to find whose rankings a write can affect)
+
+    Reads and writes take ``lock``. ``high_water`` is the id of the last
+    engine job (see ``ENGINE_TASKS``) whose write the index is known to hold.
+    """
+
+    def __init__(self):
+        self.item_raters = {}
+        self.item_likers = {}
+        self.user_likes = {}
+        self.user_seen = {}
+        self.archived = _EMPTY
+        self.built_at = time.monotonic()
+        self.stale = False
+        self.lock = threading.RLock()
+        self.high_water = 0
+
+    @classmethod
+    def from_db(cls):
+        engine = cls()
+        # Read first: writes whose jobs come later are caught up on afterwards.
+        engine.high_water = Job.objects.aggregate(top=Max('id'))['top'] or 0
+        rows = np.array(
+            list(Rating.objects.values_list('user_id', 'movie_id', 'value')),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        users, movies, values = rows[:, 0], rows[:, 1], rows[:, 2]
+        liked = values >= LIKE_THRESHOLD
+        engine.item_raters = _group(movies, users)
+        engine.user_seen = _group(users, movies)
+        engine.user_likes = _group(users[liked], movies[liked])
+        engine.item_likers = _group(movies[liked], users[liked])
+        engine.archived = np.array(
+            list(Movie.objects.filter(archived_at__isnull=False).values_list('id', flat=True)),
+            dtype=np.int64,
+        )
+        engine.archived.sort()
+        return engine
+
+    @staticmethod
+    def _add(index, key, value):
+        index[key] = np.union1d(index.get(key, _EMPTY), [value])
+
+    @staticmethod
+    def _discard(index, key, value):
+        if key in index:
+            remaining = np.setdiff1d(index[key], [value], assume_unique=True)
+            if len(remaining):
+                index[key] = remaining
+            else:
+                del index[key]
+
+    def apply_rating(self, user_id, movie_id, value):
+        """Update only the rows touched by one rating write (idempotent)."""
+        with self.lock:
+            self._add(self.item_raters, movie_id, user_id)
+            self._add(self.user_seen, user_id, movie_id)
+            if value >= LIKE_THRESHOLD:
+                self._add(self.user_likes, user_id, movie_id)
+                self._add(self.item_likers, movie_id, user_id)
+            else:
+                self._discard(self.user_likes, user_id, movie_id)
+                self._discard(self.item_likers, movie_id, user_id)
+
+    def remove_rating(self, user_id, movie_id):
+        with self.lock:
+            self._discard(self.item_raters, movie_id, user_id)
+            self._discard(self.user_seen, user_id, movie_id)
+            self._discard(self.user_likes, user_id, movie_id)
+            self._discard(self.item_likers, movie_id, user_id)
+
+    def _likers_of(self, movie_ids):
+        likers = [self.item_likers[m] for m in movie_ids if m in self.item_likers]
+        return np.unique(np.concatenate(likers)) if likers else _EMPTY
+
+    def affected_by_rating(self, user_id, movie_id):
+        """Users whose ranking can change when ``user_id`` (re)rates ``movie_id``.
+
+        That is the rater, everyone who liked the movie (the rater joins or
+        leaves their similar-user set) and everyone who liked something the
+        rater has seen (the rater is one of their similar users).
+        """
+        with self.lock:
+            seen = self.user_seen.get(user_id, _EMPTY).tolist()
+            overlap = self._likers_of(seen + [movie_id])
+        return np.union1d(overlap, [user_id]).tolist()
+
+    def affected_by_movie(self, movie_id):
+        """Users who could have ``movie_id`` as a candidate."""
+        with self.lock:
+            fans = self.item_likers.get(movie_id, _EMPTY).tolist()
+            seen = [self.user_seen[u] for u in fans if u in self.user_seen]
+            if not seen:
+                return []
+            return self._likers_of(np.unique(np.concatenate(seen)).tolist()).tolist()
+
+    def set_archived(self, movie_id, archived):
+        with self.lock:
+            if archived:
+                self.archived = np.union1d(self.archived, [movie_id])
+            else:
+                self.archived = np.setdiff1d(self.archived, [movie_id])
+
+    def score(self, user_id, limit=TOP_N):
+        """Return ``(movie_ids, scores)`` of the best unseen, non-archived movies."""
+        with self.lock:
+            return self._score(user_id, limit)
+
+    def _score(self, user_id, limit):
+        liked = self.user_likes.get(user_id)
+        if liked is None or not len(liked):
+            return _EMPTY, _EMPTY
+        raters = [self.item_raters[m] for m in liked.tolist() if m in self.item_raters]
+        if not raters:
+            return _EMPTY, _EMPTY
+        similar = np.unique(np.concatenate(raters))
+        similar = similar[similar != user_id]
+        likes = [self.user_likes[u] for u in similar.tolist() if u in self.user_likes]
+        if not likes:
+            return _EMPTY, _EMPTY
+        candidates, counts = np.unique(np.concatenate(likes), return_counts=True)
+        keep = ~np.isin(candidates, self.user_seen.get(user_id, _EMPTY), assume_unique=True)
+        keep &= ~np.isin(candidates, self.archived, assume_unique=True)
+        candidates, counts = candidates[keep], counts[keep]
+        # Highest score first; ties broken by movie id so results are stable.
+        order = np.lexsort((candidates, -counts))[:limit]
+        return candidates[order], counts[order]
+
+    def score_many(self, user_ids, limit=TOP_N):
+        """Yield ``(user_id, movie_ids, scores)`` for each of ``user_ids``.
+
+        Same results as ``score``, computed ``SCORE_BATCH`` users at a time
+        with two matrix products per batch.
+        """
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), SCORE_BATCH):
+            with self.lock:
+                batch = list(self._score_batch(user_ids[start:start + SCORE_BATCH], limit))
+            yield from batch
+
+    def _score_batch(self, user_ids, limit):
+        liked = [self.user_likes.get(u, _EMPTY) for u in user_ids]
+        seeds = np.unique(np.concatenate(liked)) if liked else _EMPTY
+        raters = [self.item_raters[m] for m in seeds.tolist() if m in self.item_raters]
+        similar = np.unique(np.concatenate(raters)) if raters else _EMPTY
+        similar_likes = [self.user_likes.get(s, _EMPTY) for s in similar.tolist()]
+        candidates = np.unique(np.concatenate(similar_likes)) if similar_likes else _EMPTY
+        if not len(candidates):
+            for user_id in user_ids:
+                yield user_id, _EMPTY, _EMPTY
+            return
+
+        cells = (len(similar) + len(user_ids)) * (len(seeds) + len(candidates))
+        if cells > MAX_DENSE_CELLS:
+            if len(user_ids) == 1:
+                yield user_ids[0], *self._score(user_ids[0], limit)
+                return
+            half = len(user_ids) // 2
+            yield from self._score_batch(user_ids[:half], limit)
+            yield from self._score_batch(user_ids[half:], limit)
+            return
+
+        # similar[b, s]: user s rated something batch user b liked (never b itself).
+        seen_seeds = _indicator([self.user_seen.get(s, _EMPTY) for s in similar.tolist()], seeds)
+        is_similar = (_indicator(liked, seeds) @ seen_seeds.T) > 0
+        users = np.asarray(user_ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(similar, users), len(similar) - 1)
+        own = np.flatnonzero(similar[pos] == users)
+        is_similar[own, pos[own]] = False
+
+        # scores[b, c]: how many of b's similar users liked candidate c.
+        scores = is_similar.astype(np.float32) @ _indicator(similar_likes, candidates)
+        scores[_indicator([self.user_seen.get(u, _EMPTY) for u in user_ids], candidates) > 0] = 0
+        scores[:, np.isin(candidates, self.archived, assume_unique=True)] = 0
+        scores = scores.round().astype(np.int64)
+
+        # Highest score first; ties broken by movie id (candidates are sorted).
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :limit]
+        for user_id, row, row_order in zip(user_ids, scores, order):
+            top = row_order[row[row_order] > 0]
+            yield user_id, candidates[top], row[top]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide engine, rebuilding it when stale or expired.
+
+    ``RECOMMENDATION_ENGINE_TTL`` (seconds, default 300) bounds how long a
+    worker may serve an index that other processes have written to.
+    """
+    global _engine
+    ttl = getattr(settings, 'RECOMMENDATION_ENGINE_TTL', 300)
+    with _engine_lock:
+        if _engine is None or _engine.stale or time.monotonic() - _engine.built_at > ttl:
+            _engine = CooccurrenceEngine.from_db()
+        return _engine
+
+
+def invalidate_engine():
+    """Force the next ``get_engine()`` call to rebuild from the database."""
+    with _engine_lock:
+        if _engine is not None:
+            _engine.stale = True
+
+
+def _catch_up(engine, pending):
+    """Apply the writes behind the engine jobs ``pending`` to ``engine``; False if it can't.
+
+    Only the pairs and movies the jobs name are read back, in their current
+    state, so the order the jobs ran in (or whether they have yet) does not
+    matter.
+    """
+    pairs, movie_ids = set(), set()
+    for task, kwargs in pending:
+        if task == task_path(refresh_after_rating):
+            pairs.add((kwargs['user_id'], kwargs['movie_id']))
+        elif task == task_path(refresh_after_ratings_removed):
+            pairs.update((user_id, movie_id) for user_id, movie_id in kwargs['pairs'])
+        elif task == task_path(refresh_after_archive):
+            movie_ids.add(kwargs['movie_id'])
+        else:
+            return False
+    values = {}
+    if pairs:
+        rows = Rating.objects.filter(
+            user_id__in={u for u, _ in pairs}, movie_id__in={m for _, m in pairs},
+        ).values_list('user_id', 'movie_id', 'value')
+        values = {(u, m): v for u, m, v in rows if (u, m) in pairs}
+    archived = dict(Movie.objects.filter(id__in=movie_ids).values_list('id', 'archived_at')) if movie_ids else {}
+    with engine.lock:
+        for user_id, movie_id in pairs:
+            if (user_id, movie_id) in values:
+                engine.apply_rating(user_id, movie_id, values[(user_id, movie_id)])
+            else:
+                engine.remove_rating(user_id, movie_id)
+        for movie_id in movie_ids:
+            engine.set_archived(movie_id, archived.get(movie_id) is not None)
+    return True
+
+
+def synced_engine():
+    """The process-wide engine, brought up to date with every committed engine job.
+
+    One indexed range read on the job table. The engine is rebuilt only if it
+    can't catch up (a ``reload_engine`` job, or more than ``CATCH_UP_LIMIT``
+    jobs behind).
+    """
+    global _engine
+    engine = get_engine()
+    with engine.lock:
+        pending = list(
+            Job.objects.filter(id__gt=engine.high_water, task__in=ENGINE_TASKS)
+            .order_by('id').values_list('id', 'task', 'kwargs')[:CATCH_UP_LIMIT + 1]
+        )
+        if not pending:
+            return engine
+        if len(pending) <= CATCH_UP_LIMIT and _catch_up(engine, [(task, kwargs) for _, task, kwargs in pending]):
+            engine.high_water = pending[-1][0]
+            return engine
+    with _engine_lock:
+        if _engine is engine:
+            _engine = CooccurrenceEngine.from_db()
+        return _engine
+
+
+def _store_capped(affected, engine):
+    """Re-rank up to ``REFRESH_USERS_PER_JOB`` of ``affected`` now and queue the rest.
+
+    Returns the users re-ranked now.
+    """
+    affected = sorted(set(affected))
+    now, later = affected[:REFRESH_USERS_PER_JOB], affected[REFRESH_USERS_PER_JOB:]
+    for start in range(0, len(later), REFRESH_USERS_PER_JOB):
+        jobs.enqueue(refresh_users, user_ids=later[start:start + REFRESH_USERS_PER_JOB])
+    store_recommendations(now, engine=engine)
+    return now
+
+
+def refresh_users(user_ids):
+    """Job: re-rank ``user_ids`` with an up-to-date engine."""
+    store_recommendations(user_ids, engine=synced_engine())
+
+
+def refresh_after_rating(user_id, movie_id, value=None):
+    """Job: bring the engine up to date with one rating write and re-rank the affected users.
+
+    ``value`` is the new rating, or ``None`` when the rating was deleted; the
+    engine reads the current state back either way (see ``synced_engine``).
+    """
+    engine = synced_engine()
+    stored = _store_capped(engine.affected_by_rating(user_id, movie_id), engine)
+    # The movie's average moved for everyone showing it, re-ranked or not.
+    bump_picks_showing([movie_id], exclude=stored)
+
+
+def refresh_after_ratings_removed(pairs):
+    """Job: like ``refresh_after_rating`` for many deleted ``(user_id, movie_id)`` pairs.
+
+    Used for cascades (a movie or user being deleted) so each affected user is
+    re-ranked once rather than once per removed rating.
+    """
+    engine = synced_engine()
+    affected = set()
+    for user_id, movie_id in pairs:
+        affected.update(engine.affected_by_rating(user_id, movie_id))
+    stored = _store_capped(affected, engine)
+    bump_picks_showing({movie_id for _, movie_id in pairs}, exclude=stored)
+
+
+def refresh_after_archive(movie_id, archived):
+    """Job: drop (or re-admit) a movie from every stored ranking it affects."""
+    engine = synced_engine()
+    if archived:
+        affected = list(
+            UserRecommendation.objects.filter(movie_id=movie_id)
+            .values_list('user_id', flat=True)
+        )
+    else:
+        affected = engine.affected_by_movie(movie_id)
+    _store_capped(affected, engine)
+
+
+def reload_engine():
+    """Job marking a bulk write the signals didn't see: every engine rebuilds."""
+    synced_engine()
+
+
+# Jobs recording a write the engine has to reflect.
+ENGINE_TASKS = [
+    task_path(f) for f in (refresh_after_rating, refresh_after_ratings_removed, refresh_after_archive, reload_engine)
+]
+
+
+def get_recommendations(user, limit=TOP_N):
+    if not getattr(user, 'id', None):
+        return []
+    movie_ids, _ = get_engine().score(user.id, limit=limit)
+    movie_ids = movie_ids.tolist()
+    movies = Movie.objects.in_bulk(movie_ids)
+    return [movies[i] for i in movie_ids if i in movies and movies[i].archived_at is None]
+
+
+def store_recommendations(user_ids=None, batch_size=500, engine=None):
+    """Recompute and persist ``UserRecommendation`` rows.
+
+    Scores ``user_ids`` (every user when omitted) in batches of ``batch_size``,
+    replacing each batch's rows in a single transaction. Returns the number of
+    users processed.
+    """
+    engine = engine or get_engine()
+    if user_ids is None:
+        user_ids = User.objects.order_by('id').values_list('id', flat=True).iterator()
+    processed = 0
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            processed += _store_batch(engine, batch)
+            batch = []
+    if batch:
+        processed += _store_batch(engine, batch)
+    return processed
+
+
+def _store_batch(engine, user_ids):
+    now = timezone.now()
+    rows = []
+    for user_id, movie_ids, scores in engine.score_many(user_ids, limit=STORED_PER_USER):
+        rows.extend(
+            UserRecommendation(user_id=user_id, movie_id=movie_id, score=score, rank=rank, computed_at=now)
+            for rank, (movie_id, score) in enumerate(zip(movie_ids.tolist(), scores.tolist()), start=1)
+        )
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.bulk_create(rows)
+    transaction.on_commit(lambda: versions.bump(versions.RECOMMENDATIONS, user_ids))
+    return len(user_ids)
+
+
+def bump_picks_showing(movie_ids, exclude=()):
+    """New ``RECOMMENDATIONS`` token for every user whose Top Picks show ``movie_ids``.
+
+    For rating aggregate changes: they alter the averages shown in those
+    users' Top Picks and no one else's. Only the ``TOP_N`` picks on screen
+    count, not the spares. Runs in the rating jobs, off the request, as a
+    single cache write; ``exclude`` skips users whose token a re-rank has
+    just bumped anyway.
+    """
+    user_ids = set(
+        UserRecommendation.objects.filter(movie_id__in=list(movie_ids), rank__lte=TOP_N)
+        .values_list('user_id', flat=True)
+    ) - set(exclude)
+    if user_ids:
+        versions.bump(versions.RECOMMENDATIONS, sorted(user_ids))
+
+
+def get_precomputed_recommendations(user, limit=TOP_N):
+    """Read the user's stored picks in one indexed query."""
+    if not getattr(user, 'id', None):
+        return []
+    rows = (
+        UserRecommendation.objects
+        .filter(user_id=user.id, movie__archived_at__isnull=True)
+        .select_related('movie')
+        .order_by('rank')[:limit]
+    )
+    return [r.movie for r in rows]
@@ -0,0 +1,63 @@
+"""Process-wide record of which tables and columns exist in the database.
+
+Several views guard against a database whose migrations have not been applied
+yet (e.g. Rating without ``created_at``). Introspecting the schema costs a
+catalog query, so what was found is remembered for the life of the process.
+Only what exists is remembered: a table or column that is missing is looked
+up again on the next check, so a process started before ``migrate`` notices
+it without a restart. ``refresh()`` forgets everything and is called after
+``migrate``.
+"""
+import threading
+
+from django.db import connection
+
+from .models import Rating
+
+_tables = frozenset()
+_columns = {}
+_lock = threading.Lock()
+
+
+def _has_table(table_name):
+    global _tables
+    if table_name not in _tables:
+        _tables = frozenset(connection.introspection.table_names())
+    return table_name in _tables
+
+
+def has_table(table_name):
+    try:
+        with _lock:
+            return _has_table(table_name)
+    except Exception:
+        # Don't remember failures (e.g. the database being unreachable).
+        return False
+
+
+def has_column(model, column_name):
+    table_name = model._meta.db_table
+    try:
+        with _lock:
+            if column_name not in _columns.get(table_name, ()):
+                if not _has_table(table_name):
+                    return False
+                with connection.cursor() as cursor:
+                    description = connection.introspection.get_table_description(cursor, table_name)
+                _columns[table_name] = frozenset(c.name for c in description)
+            return column_name in _columns[table_name]
+    except Exception:
+        return False
+
+
+def ratings_ready():
+    """True once Rating has its ``created_at`` column (migrations applied)."""
+    return has_column(Rating, 'created_at')
+
+
+def refresh(**kwargs):
+    """Forget the cached schema; the next check introspects again."""
+    global _tables
+    with _lock:
+        _tables = frozenset()
+        _columns.clear()
@@ -0,0 +1,171 @@
+"""Ranked full-text search over movie title, genre and description.
+
+The index lives in the database and is maintained by the database itself, so
+every write path (views, admin, bulk_create, queryset.update) keeps it fresh:
+
+- SQLite: an external-content FTS5 table kept in step by triggers (a
+  migration that rebuilds the movie table drops them, so they are checked
+  and re-created after every ``migrate``)
+- PostgreSQL: a GIN index over a weighted tsvector expression
+- anything else: the old per-token ``icontains`` filter, unranked
+
+Every search is a prefix match on each word of the query, with all words
+required. Results are ordered by relevance (title > genre > description) and
+then newest first. The (rank, id) pair doubles as the keyset cursor for paging.
+The cursor carries the exact text of the rank the database produced, so the
+rank a page ended on compares equal when it comes back: SQLite's doubles
+round-trip through ``repr()``, and PostgreSQL's float4 ``ts_rank`` is cast to
+numeric in the query, for ordering and comparing alike.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from importlib import import_module
+
+from django.db import connection, connections
+from django.db.models import BooleanField, DecimalField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from . import schema
+from .models import Movie
+from .pagination import MOVIE_PAGE_SIZE
+
+FTS_TABLE = 'moviehub_movie_fts'
+
+# Must match the expression indexed by migration 0009 so PostgreSQL uses the index.
+PG_VECTOR = (
+    "(setweight(to_tsvector('simple', coalesce(moviehub_movie.title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(moviehub_movie.genre, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(moviehub_movie.description, '')), 'C'))"
+)
+
+
+SQLITE_TRIGGERS = frozenset({'moviehub_movie_fts_ai', 'moviehub_movie_fts_ad', 'moviehub_movie_fts_au'})
+
+
+def ensure_sqlite_triggers(using='default'):
+    """Re-create the FTS sync triggers (and rebuild the index) if any are missing.
+
+    Returns True when it had to. Does nothing on other databases or before
+    the index exists.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return False
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        names = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in names or SQLITE_TRIGGERS <= names:
+            return False
+        for sql in import_module('moviehub.migrations.0009_movie_search_index').SQLITE_FORWARD:
+            cursor.execute(sql)
+    return True
+
+
+def tokenize(query):
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _after(movies, after):
+    """Rows of ``movies`` (annotated with ``search_rank``) past the cursor ``after``."""
+    if not after:
+        return movies
+    rank, movie_id = after
+    return movies.filter(Q(search_rank__lt=rank) | Q(search_rank=rank, id__lt=movie_id))
+
+
+class SQLiteFTSBackend:
+    # bm25() is "lower is better"; negate it so every backend ranks descending.
+    rank_sql = (
+        f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = moviehub_movie.id'
+    )
+
+    def rank_value(self, text):
+        return float(text)
+
+    def ranked(self, movies, tokens, after=None):
+        match = ' '.join(f'"{t}"*' for t in tokens)
+        movies = movies.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        ).annotate(search_rank=RawSQL(self.rank_sql, [match], output_field=FloatField()))
+        return _after(movies, after).order_by('-search_rank', '-id')
+
+
+class PostgresFTSBackend:
+    # As numeric: exact in Python (Decimal) and in the cursor.
+    rank_sql = f"CAST(ts_rank({PG_VECTOR}, to_tsquery('simple', %s)) AS numeric)"
+
+    def rank_value(self, text):
+        return Decimal(text)
+
+    def ranked(self, movies, tokens, after=None):
+        tsquery = ' & '.join(f'{t}:*' for t in tokens)
+        movies = movies.filter(
+            RawSQL(f"{PG_VECTOR} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(search_rank=RawSQL(self.rank_sql, [tsquery], output_field=DecimalField()))
+        return _after(movies, after).order_by('-search_rank', '-id')
+
+
+class ContainsBackend:
+    """Fallback when no full-text index is available: substring match, no ranking."""
+
+    def rank_value(self, text):
+        return 0.0
+
+    def ranked(self, movies, tokens, after=None):
+        for token in tokens:
+            movies = movies.filter(Q(title__icontains=token) | Q(genre__icontains=token) | Q(description__icontains=token))
+        if after:
+            movies = movies.filter(id__lt=after[1])
+        return movies.annotate(search_rank=Value(0.0, output_field=FloatField())).order_by('-id')
+
+
+def get_backend():
+    if connection.vendor == 'sqlite' and schema.has_table(FTS_TABLE):
+        return SQLiteFTSBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresFTSBackend()
+    return ContainsBackend()
+
+
+def ranked(movies, query):
+    """Restrict ``movies`` to matches for ``query``, best first, annotated with ``search_rank``."""
+    tokens = tokenize(query)
+    if not tokens:
+        return movies.order_by('-id')
+    return get_backend().ranked(movies, tokens)
+
+
+def rank_among(movies, query):
+    """Filter and re-order an in-memory list of movies by relevance to ``query``."""
+    tokens = tokenize(query)
+    if not tokens or not movies:
+        return list(movies)
+    ids = get_backend().ranked(Movie.objects.filter(id__in=[m.id for m in movies]), tokens)
+    by_id = {m.id: m for m in movies}
+    return [by_id[i] for i in ids.values_list('id', flat=True)]
+
+
+def parse_search_cursor(value, backend=None):
+    """Decode a ``"<rank>:<id>"`` cursor produced by ``search_page``."""
+    backend = backend or get_backend()
+    try:
+        rank, movie_id = str(value).rsplit(':', 1)
+        return backend.rank_value(rank), int(movie_id)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+
+
+def search_page(movies, query, cursor=None, page_size=MOVIE_PAGE_SIZE):
+    """Keyset page of ranked search results; returns ``(movies, next_cursor)``."""
+    tokens = tokenize(query)
+    backend = get_backend()
+    after = parse_search_cursor(cursor, backend) if cursor else None
+    results = list(backend.ranked(movies, tokens, after=after)[:page_size + 1])
+    if len(results) > page_size:
+        results = results[:page_size]
+        last = results[-1]
+        # repr() of SQLite's double, str() of PostgreSQL's numeric: both exact
+        rank = repr(last.search_rank) if isinstance(last.search_rank, float) else str(last.search_rank)
+        return results, f'{rank}:{last.id}'
+    return results, None
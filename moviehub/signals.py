@@ -0,0 +1,205 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .aggregates import apply_rating_delta, recompute_rating_aggregates
+from .facets import invalidate_facets
+from .models import CatalogEvent, Movie, Rating, movie_archived, movie_restored
+from . import activity, jobs, schema, search, versions
+from .recommendations import (
+    refresh_after_archive,
+    refresh_after_rating,
+    refresh_after_ratings_removed,
+)
+
+
+@receiver(post_save, sender=Movie)
+def sync_movie_genres(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'genre' not in update_fields):
+        return
+    instance.sync_genres()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(movie_archived, sender=Movie)
+@receiver(movie_restored, sender=Movie)
+def catalog_changed(sender, signal=None, update_fields=None, **kwargs):
+    if signal is post_save and update_fields is not None and set(update_fields) <= {'archived_at'}:
+        # archive() / restore(): handled once, on their own signals.
+        return
+    transaction.on_commit(invalidate_facets)
+    transaction.on_commit(lambda: versions.bump(versions.CATALOG))
+
+
+# Journal rows are written in the same transaction as the change they record,
+# so a client never sees an event before the change itself is visible.
+@receiver(post_save, sender=Movie)
+def journal_movie_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if not created and update_fields is not None and set(update_fields) <= {'archived_at'}:
+        # archive() / restore(): journaled by their own signals below.
+        return
+    kind = CatalogEvent.ADDED if created else CatalogEvent.EDITED
+    CatalogEvent.objects.create(movie_id=instance.id, kind=kind)
+
+
+@receiver(movie_archived, sender=Movie)
+def journal_movie_archived(sender, instance, **kwargs):
+    CatalogEvent.objects.create(movie_id=instance.id, kind=CatalogEvent.ARCHIVED)
+
+
+@receiver(movie_restored, sender=Movie)
+def journal_movie_restored(sender, instance, **kwargs):
+    CatalogEvent.objects.create(movie_id=instance.id, kind=CatalogEvent.RESTORED)
+
+
+@receiver(post_delete, sender=Movie)
+def journal_movie_deleted(sender, instance, **kwargs):
+    CatalogEvent.objects.create(movie_id=instance.id, kind=CatalogEvent.DELETED)
+
+
+# The Top Picks of users showing the rated movie are bumped by the rating
+# job (``bump_picks_showing``), not here in the request.
+def _ratings_changed(user_ids):
+    versions.bump_all(versions.RATINGS, *((versions.RATINGS, user_id) for user_id in user_ids))
+
+
+@receiver(post_save, sender=Rating)
+def ratings_version_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: _ratings_changed([user_id]))
+
+
+@receiver(post_delete, sender=Rating)
+def ratings_version_on_delete(sender, instance, origin=None, **kwargs):
+    owner = origin if origin is not None else instance
+    pending = getattr(owner, '_ratings_version_pending', None)
+    if pending is None:
+        # One round of bumps per delete() call, however many ratings it cascades to.
+        pending = owner._ratings_version_pending = set()
+        transaction.on_commit(lambda: _ratings_changed(pending))
+    pending.add(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def users_version_changed(sender, **kwargs):
+    transaction.on_commit(lambda: versions.bump(versions.USERS))
+
+
+@receiver(post_save, sender=Rating)
+def update_movie_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: the fixture's Movie rows already carry the aggregates.
+        return
+    if created:
+        apply_rating_delta(instance.movie_id, instance.value, 1)
+    elif hasattr(instance, '_loaded_value') and instance._loaded_value is not None:
+        apply_rating_delta(instance.movie_id, instance.value - instance._loaded_value)
+    else:
+        # Updated through an instance that was never loaded from the DB, so
+        # the previous value is unknown: recount this one movie.
+        recompute_rating_aggregates(Movie.objects.filter(pk=instance.movie_id))
+    instance._loaded_value = instance.value
+
+
+@receiver(post_delete, sender=Rating)
+def update_movie_aggregates_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Movie):
+        # The movie itself is going away; nothing left to keep in step.
+        return
+    value = getattr(instance, '_loaded_value', instance.value)
+    apply_rating_delta(instance.movie_id, -value, -1)
+
+
+# Re-ranking runs as a background job (moviehub.jobs), queued in the same
+# transaction as the write so it never runs before, or without, it.
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    jobs.enqueue(refresh_after_rating, user_id=instance.user_id, movie_id=instance.movie_id, value=instance.value)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, origin=None, **kwargs):
+    if origin is not None and origin is not instance:
+        # Cascade from a deleted movie or user: collect the removed pairs on
+        # the origin and re-rank everyone they affect in a single pass.
+        pending = getattr(origin, '_removed_ratings', None)
+        if pending is None:
+            pending = origin._removed_ratings = []
+            transaction.on_commit(lambda: jobs.enqueue(refresh_after_ratings_removed, pairs=pending))
+        pending.append((instance.user_id, instance.movie_id))
+        return
+    jobs.enqueue(refresh_after_rating, user_id=instance.user_id, movie_id=instance.movie_id)
+
+
+@receiver(movie_archived, sender=Movie)
+def movie_was_archived(sender, instance, **kwargs):
+    jobs.enqueue(refresh_after_archive, movie_id=instance.id, archived=True)
+
+
+@receiver(movie_restored, sender=Movie)
+def movie_was_restored(sender, instance, **kwargs):
+    jobs.enqueue(refresh_after_archive, movie_id=instance.id, archived=False)
+
+
+@receiver(post_save, sender=Rating)
+def rating_activity_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        activity.record_rating(instance)
+
+
+@receiver(post_save, sender=User)
+def user_activity_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        activity.record_new_user(instance)
+
+
+@receiver(post_save, sender=Rating)
+def rating_count_changed_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: activity.touch_raters([user_id]))
+
+
+@receiver(post_delete, sender=Rating)
+def rating_count_changed_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User):
+        # The user is going away along with their ratings.
+        return
+    owner = origin if origin is not None else instance
+    pending = getattr(owner, '_touched_raters', None)
+    if pending is None:
+        pending = owner._touched_raters = set()
+        transaction.on_commit(lambda: activity.touch_raters(pending))
+    pending.add(instance.user_id)
+
+
+@receiver(post_delete, sender=Rating)
+@receiver(post_delete, sender=User)
+def activity_on_delete(sender, instance, origin=None, **kwargs):
+    day = activity.day_of(instance.date_joined if sender is User else instance.created_at)
+    if day is None:
+        return
+    # Deletes can't be undone by a decrement without knowing what else the
+    # user did that day, so recount the touched days once, after commit.
+    owner = origin if origin is not None else instance
+    pending = getattr(owner, '_activity_days', None)
+    if pending is None:
+        pending = owner._activity_days = set()
+        transaction.on_commit(lambda: activity.rebuild_days(pending))
+    pending.add(day)
+
+
+@receiver(post_migrate)
+def schema_migrated(sender, app_config=None, using='default', **kwargs):
+    schema.refresh()
+    if app_config is not None and app_config.name == 'moviehub':
+        search.ensure_sqlite_triggers(using)
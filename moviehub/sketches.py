@@ -0,0 +1,141 @@
+"""Mergeable distinct-count sketches of user ids.
+
+Each ``DailyActivity`` row keeps one sketch of the users who rated that day.
+Sketches for any set of days merge into one that counts the distinct users
+across all of them, so "active users this quarter" reads one small value per
+day instead of every rating in the quarter.
+
+A sketch is serialized to bytes with a one-byte header naming its encoding:
+
+- ``BITSET``: one bit per user id. Exact. Used while every id in it is below
+  ``BITSET_MAX_ID``, which keeps it no larger than the HyperLogLog form.
+- ``HLL``: a HyperLogLog with ``2 ** HLL_PRECISION`` one-byte registers
+  (4 KiB). Its relative standard error is 1.04 / sqrt(4096), about 1.6%, so
+  roughly 95% of estimates land within 3.3% of the true count. Small counts
+  use linear counting, which is much closer than that.
+
+Merging two bitsets stays exact. Merging anything with a HyperLogLog gives a
+HyperLogLog.
+"""
+import numpy as np
+
+BITSET = 0
+HLL = 1
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+BITSET_MAX_ID = HLL_REGISTERS * 8
+
+_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+
+def _hash(ids):
+    """splitmix64 of each id: a well-mixed, stable 64-bit hash."""
+    with np.errstate(over='ignore'):
+        z = np.asarray(ids, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _leading_zeros(values):
+    values = values.copy()
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_clear = values < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[top_clear] += shift
+        values[top_clear] <<= np.uint64(shift)
+    zeros[values == 0] = 64
+    return zeros
+
+
+class UserSketch:
+    """Distinct count of user ids; see the module docstring for the encodings."""
+
+    def __init__(self, kind=BITSET, data=None):
+        self.kind = kind
+        if data is None:
+            data = np.zeros(HLL_REGISTERS if kind == HLL else 0, dtype=np.uint8)
+        self.data = data
+
+    @classmethod
+    def of(cls, user_ids):
+        sketch = cls()
+        sketch.add(user_ids)
+        return sketch
+
+    @classmethod
+    def from_bytes(cls, raw):
+        if not raw:
+            return cls()
+        raw = bytes(raw)
+        return cls(raw[0], np.frombuffer(raw, dtype=np.uint8, offset=1).copy())
+
+    def to_bytes(self):
+        return bytes([self.kind]) + self.data.tobytes()
+
+    def _to_hll(self):
+        if self.kind == HLL:
+            return
+        ids = np.flatnonzero(np.unpackbits(self.data, bitorder='little'))
+        self.kind, self.data = HLL, np.zeros(HLL_REGISTERS, dtype=np.uint8)
+        self._add_hashed(ids)
+
+    def _add_hashed(self, ids):
+        if not len(ids):
+            return
+        hashes = _hash(ids)
+        index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+        rest = hashes << np.uint64(HLL_PRECISION)
+        # Rank = 1 + leading zeros of the remaining 64 - p bits (capped).
+        bits = 64 - HLL_PRECISION
+        ranks = np.minimum(_leading_zeros(rest) + 1, bits + 1).astype(np.uint8)
+        np.maximum.at(self.data, index, ranks)
+
+    def add(self, user_ids):
+        ids = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+        if not len(ids):
+            return self
+        if self.kind == BITSET and ids[-1] < BITSET_MAX_ID:
+            size = max(len(self.data), int(ids[-1]) // 8 + 1)
+            bits = np.zeros(size * 8, dtype=np.uint8)
+            bits[ids] = 1
+            added = np.packbits(bits, bitorder='little')
+            added[:len(self.data)] |= self.data
+            self.data = added
+            return self
+        self._to_hll()
+        self._add_hashed(ids)
+        return self
+
+    def merge(self, other):
+        if self.kind == BITSET and other.kind == BITSET:
+            if len(other.data) > len(self.data):
+                self.data = np.concatenate((self.data, np.zeros(len(other.data) - len(self.data), dtype=np.uint8)))
+            self.data[:len(other.data)] |= other.data
+            return self
+        other = UserSketch(other.kind, other.data.copy())
+        other._to_hll()
+        self._to_hll()
+        np.maximum(self.data, other.data, out=self.data)
+        return self
+
+    def count(self):
+        if self.kind == BITSET:
+            return int(np.unpackbits(self.data).sum())
+        registers = self.data.astype(np.float64)
+        estimate = _ALPHA * HLL_REGISTERS ** 2 / np.sum(np.exp2(-registers))
+        zeros = int(np.count_nonzero(self.data == 0))
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            # Linear counting is far more accurate in the small range.
+            estimate = HLL_REGISTERS * np.log(HLL_REGISTERS / zeros)
+        return int(round(estimate))
+
+
+def merged_count(raw_sketches):
+    """Distinct users across serialized sketches."""
+    total = UserSketch()
+    for raw in raw_sketches:
+        if raw:
+            total.merge(UserSketch.from_bytes(raw))
+    return total.count()
@@ -0,0 +1,72 @@
+"""CSV / JSON Lines rows for the bulk import and export commands.
+
+Both formats are read and written one row at a time, so the commands run in
+flat memory however large the file is. ``-`` stands for standard input or
+output.
+"""
+import csv
+import json
+import sys
+from contextlib import contextmanager
+from itertools import islice
+
+FORMATS = ('csv', 'jsonl')
+
+# What a malformed file raises while it is being read.
+READ_ERRORS = (csv.Error, json.JSONDecodeError, UnicodeDecodeError)
+
+
+def guess_format(path, fmt=None):
+    """``fmt`` if given, else from the file extension (csv for standard input/output)."""
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+@contextmanager
+def read_rows(path, fmt):
+    """Iterate over the rows of ``path`` as dicts (keyed by the CSV header)."""
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+    try:
+        yield _rows(stream, fmt)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+@contextmanager
+def write_rows(path, fmt, fields):
+    """Yield a ``write(values)`` function appending one row of ``fields`` to ``path``."""
+    stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    try:
+        if fmt == 'csv':
+            writer = csv.writer(stream)
+            writer.writerow(fields)
+            yield writer.writerow
+        else:
+            yield lambda values: stream.write(json.dumps(dict(zip(fields, values))) + '\n')
+    finally:
+        if stream is sys.stdout:
+            stream.flush()
+        else:
+            stream.close()
+
+
+def batches(rows, size):
+    """Lists of up to ``size`` items from ``rows``."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
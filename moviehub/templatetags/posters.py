@@ -0,0 +1,35 @@
+from django import template
+from django.utils.html import format_html
+
+from ..posters import DEFAULT_SIZES, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def poster_srcset(movie, fmt='jpeg'):
+    """`srcset` value listing the poster's `fmt` renditions ('' until they exist)."""
+    return srcset(movie, fmt)
+
+
+@register.simple_tag
+def poster_picture(movie, css_class='poster', sizes=DEFAULT_SIZES):
+    """<picture> offering the WebP and JPEG renditions, sized by `sizes`.
+
+    Falls back to a plain <img> of the original poster until renditions exist.
+    """
+    try:
+        original = movie.poster.url
+    except Exception:
+        return ''
+    jpeg, webp = srcset(movie, 'jpeg'), srcset(movie, 'webp')
+    if not jpeg:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', original, movie.title, css_class)
+    largest = jpeg.rsplit(', ', 1)[-1].rsplit(' ', 1)[0]
+    return format_html(
+        '<picture class="poster-picture">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy">'
+        '</picture>',
+        webp, sizes, largest, jpeg, sizes, movie.title, css_class,
+    )
@@ -1,3 +1,916 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import activity, events, jobs, posters, recommendations, search, sketches, versions
+from .aggregates import drifted_movies, recompute_rating_aggregates
+from .facets import get_facets
+from .management.commands import import_movies
+from .models import CatalogEvent, DailyActivity, Job, Movie, Rating, StagedUpload, UserRecommendation
+from .pagination import movie_page, parse_cursor, parse_timestamp_cursor, timestamp_page
+from .recommendations import CooccurrenceEngine, synced_engine
+from .sketches import UserSketch, merged_count
+
+
+def _movie(title='Movie', **kwargs):
+    kwargs.setdefault('genre', 'Drama')
+    kwargs.setdefault('release_year', 2000)
+    kwargs.setdefault('description', '')
+    return Movie.objects.create(title=title, **kwargs)
+
+
+class EngineScoringTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'user{i}') for i in range(4)]
+        cls.movies = [_movie(f'Movie {i}') for i in range(5)]
+        m = cls.movies
+        u0, u1, u2, u3 = cls.users
+        for user, movie, value in [
+            (u0, m[0], 5),
+            # u1 and u2 also rated m0; u1 liked m1 and m2, u2 liked m1 only
+            (u1, m[0], 4), (u1, m[1], 5), (u1, m[2], 4),
+            (u2, m[0], 2), (u2, m[1], 4), (u2, m[3], 1),
+            # u3 shares nothing with u0
+            (u3, m[4], 5),
+        ]:
+            Rating.objects.create(user=user, movie=movie, value=value)
+
+    def test_scores_count_similar_users_who_liked(self):
+        engine = CooccurrenceEngine.from_db()
+        movie_ids, scores = engine.score(self.users[0].id)
+        m = self.movies
+        self.assertEqual(movie_ids.tolist(), [m[1].id, m[2].id])
+        self.assertEqual(scores.tolist(), [2, 1])
+
+    def test_archived_and_seen_movies_are_left_out(self):
+        self.movies[1].archive()
+        engine = CooccurrenceEngine.from_db()
+        movie_ids, _ = engine.score(self.users[0].id)
+        self.assertEqual(movie_ids.tolist(), [self.movies[2].id])
+        movie_ids, _ = engine.score(self.users[1].id)
+        self.assertNotIn(self.movies[0].id, movie_ids.tolist())
+
+    def test_score_many_matches_score(self):
+        engine = CooccurrenceEngine.from_db()
+        user_ids = [u.id for u in self.users]
+        for user_id, movie_ids, scores in engine.score_many(user_ids):
+            expected_ids, expected_scores = engine.score(user_id)
+            self.assertEqual(movie_ids.tolist(), expected_ids.tolist())
+            self.assertEqual(scores.tolist(), expected_scores.tolist())
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rater')
+        self.movie = _movie()
+
+    def assertAggregates(self, rating_sum, rating_count):
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (rating_sum, rating_count))
+
+    def test_create_update_delete(self):
+        rating = Rating.objects.create(user=self.user, movie=self.movie, value=4)
+        self.assertAggregates(4, 1)
+        other = Rating.objects.create(user=User.objects.create_user('other'), movie=self.movie, value=2)
+        self.assertAggregates(6, 2)
+        rating.value = 1
+        rating.save()
+        self.assertAggregates(3, 2)
+        rating.delete()
+        self.assertAggregates(2, 1)
+        other.delete()
+        self.assertAggregates(0, 0)
+        self.assertFalse(drifted_movies().exists())
+
+    def test_update_of_instance_loaded_from_db(self):
+        Rating.objects.create(user=self.user, movie=self.movie, value=5)
+        rating = Rating.objects.get(user=self.user, movie=self.movie)
+        rating.value = 3
+        rating.save()
+        self.assertAggregates(3, 1)
+
+    def test_queryset_delete(self):
+        for i in range(3):
+            Rating.objects.create(user=User.objects.create_user(f'u{i}'), movie=self.movie, value=i + 1)
+        self.assertAggregates(6, 3)
+        Rating.objects.filter(value__gte=2).delete()
+        self.assertAggregates(1, 1)
+
+    def test_raw_save_is_skipped(self):
+        rating = Rating(user=self.user, movie=self.movie, value=5)
+        rating.save_base(raw=True)
+        # Fixture loads carry their own aggregates; the handler leaves them be.
+        self.assertAggregates(0, 0)
+
+
+# Production settings redirect plain HTTP; the API tests talk to the views directly.
+api = override_settings(SECURE_SSL_REDIRECT=False)
+
+
+@api
+class MoviePageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [_movie(f'Movie {i}') for i in range(7)]
+        cls.user = User.objects.create_user('viewer', password='pw')
+
+    def test_pages_cover_everything_once(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = movie_page(Movie.objects.all(), cursor, page_size=3)
+            seen += [m.id for m in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted((m.id for m in self.movies), reverse=True))
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor('12'), 12)
+        for value in (None, '', 'x', '0', '-3'):
+            self.assertIsNone(parse_cursor(value))
+
+    def test_api_pages_follow_the_cursor(self):
+        self.client.force_login(self.user)
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get('/api/movies/page/', {'cursor': cursor}).json()
+            seen += [card['id'] for card in data['results']]
+            cursor = data['next_cursor']
+        self.assertEqual(seen, sorted((m.id for m in self.movies), reverse=True))
+
+
+@api
+class TimestampPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [_movie(f'Movie {i}') for i in range(7)]
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_pages_with_ties_and_nulls(self):
+        moment = timezone.now()
+        stamps = [moment, moment, moment - datetime.timedelta(days=1), None, None, moment]
+        for movie, stamp in zip(self.movies, stamps):
+            Movie.objects.filter(pk=movie.pk).update(archived_at=stamp)
+        queryset = Movie.objects.filter(id__in=[m.id for m in self.movies[:len(stamps)]])
+        # Newest first, ties broken by id, rows without a timestamp last.
+        movies = sorted(queryset, key=lambda m: (m.archived_at is not None, m.archived_at or moment, m.id), reverse=True)
+        expected = [m.id for m in movies]
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = timestamp_page(queryset.values('id', 'archived_at'), 'archived_at', cursor, page_size=2)
+            seen += [row['id'] for row in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_timestamp_cursor('-:5'), (None, 5))
+        moment, pk = parse_timestamp_cursor('1000000:9')
+        self.assertEqual((moment, pk), (datetime.datetime(1970, 1, 1, 0, 0, 1, tzinfo=datetime.timezone.utc), 9))
+        for value in ('nonsense', '1:2:3', 'x:1'):
+            self.assertIsNone(parse_timestamp_cursor(value))
+
+    def test_admin_ratings_api_pages_and_exports(self):
+        users = [User.objects.create_user(f'rater{i}') for i in range(5)]
+        for user in users:
+            Rating.objects.create(user=user, movie=self.movies[0], value=3)
+        self.client.force_login(self.staff)
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get('/api/admin/ratings/', {'cursor': cursor, 'page_size': 2}).json()
+            seen += [row['user'] for row in data['results']]
+            cursor = data['next_cursor']
+        self.assertCountEqual(seen, [u.username for u in users])
+
+        response = self.client.get('/api/admin/ratings/', {'export': 'csv'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'user', 'movie', 'value', 'created_at'])
+        self.assertEqual(len(rows), 1 + len(users))
+
+    def test_admin_ratings_api_is_staff_only(self):
+        self.client.force_login(User.objects.create_user('plain'))
+        self.assertEqual(self.client.get('/api/admin/ratings/').status_code, 403)
+
+
+@api
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_title = _movie('Harbour Lights', description='A quiet town.')
+        cls.in_description = _movie('Quiet Town', description='Lights over the harbour.')
+        # Identical rows tie on rank, so paging must fall back to the id.
+        cls.ties = [_movie('Harbour', description='Same words.') for _ in range(5)]
+        _movie('Elsewhere', description='Nothing to see.')
+
+    def test_title_matches_rank_first(self):
+        ranked = list(search.ranked(Movie.objects.all(), 'lights'))
+        self.assertEqual(ranked, [self.in_title, self.in_description])
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(list(search.ranked(Movie.objects.all(), 'harb ligh')), [self.in_title, self.in_description])
+        self.assertEqual(list(search.ranked(Movie.objects.all(), 'harbour nowhere')), [])
+
+    def test_pages_match_the_full_ranking(self):
+        expected = list(search.ranked(Movie.objects.all(), 'harbour'))
+        seen, cursor = [], None
+        while True:
+            page, cursor = search.search_page(Movie.objects.all(), 'harbour', cursor, page_size=2)
+            seen += page
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 7)
+
+    def test_cursor_keeps_the_exact_rank(self):
+        page, cursor = search.search_page(Movie.objects.all(), 'harbour', page_size=1)
+        self.assertEqual(search.parse_search_cursor(cursor), (page[0].search_rank, page[0].id))
+        self.assertIsNone(search.parse_search_cursor('nonsense'))
+
+    def test_dashboard_api_search(self):
+        self.client.force_login(User.objects.create_user('searcher'))
+        data = self.client.get('/api/movies/page/', {'q': 'lights'}).json()
+        self.assertEqual([card['id'] for card in data['results']], [self.in_title.id, self.in_description.id])
+
+
+class SearchTriggerTests(TestCase):
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('the FTS triggers are SQLite only')
+
+    def _triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_triggers_survive_migrations(self):
+        # Later migrations rebuild moviehub_movie on SQLite, which drops triggers.
+        self.assertLessEqual(search.SQLITE_TRIGGERS, self._triggers())
+        movie = _movie('Zyzzyva Returns')
+        self.assertEqual(list(search.ranked(Movie.objects.all(), 'zyzzyva')), [movie])
+
+    def test_missing_trigger_is_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER moviehub_movie_fts_ai')
+        self.assertTrue(search.ensure_sqlite_triggers())
+        self.assertLessEqual(search.SQLITE_TRIGGERS, self._triggers())
+        self.assertFalse(search.ensure_sqlite_triggers())
+        movie = _movie('Quokka Island')
+        self.assertEqual(list(search.ranked(Movie.objects.all(), 'quokka')), [movie])
+
+
+def _image(width, height, fmt='PNG', color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format=fmt)
+    return ContentFile(buffer.getvalue())
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class PosterRenditionTests(MediaRootMixin, TestCase):
+    def test_renditions_are_made_and_listed(self):
+        movie = _movie()
+        movie.poster.save('x.png', _image(400, 600))
+        posters.process(movie)
+        sizes = posters.current_sizes(movie)
+        # Never upscaled past the original's 400px.
+        self.assertEqual(sorted(sizes), [160, 320, 400])
+        for width, names in sizes.items():
+            with movie.poster.storage.open(names['jpeg']) as f:
+                self.assertEqual(Image.open(f).width, width)
+        self.assertIn('320w', posters.srcset(movie, 'webp'))
+
+    def test_shared_names_are_not_overwritten(self):
+        first, second = _movie('First'), _movie('Second')
+        first.poster.save('x.jpg', _image(200, 300, 'JPEG', (255, 0, 0)))
+        second.poster.save('x.png', _image(200, 300, 'PNG', (0, 0, 255)))
+        posters.process(first)
+        posters.process(second)
+        red, blue = posters.current_sizes(first)[160]['jpeg'], posters.current_sizes(second)[160]['jpeg']
+        self.assertNotEqual(red, blue)
+        with first.poster.storage.open(red) as f:
+            self.assertGreater(Image.open(f).convert('RGB').getpixel((5, 5))[0], 200)
+
+    def test_reprocessing_drops_only_own_old_files(self):
+        movie, other = _movie('Mine'), _movie('Other')
+        movie.poster.save('a.png', _image(200, 300))
+        other.poster.save('b.png', _image(200, 300))
+        posters.process(movie)
+        posters.process(other)
+        old = posters.current_sizes(movie)[160]['jpeg']
+        movie.poster.save('c.png', _image(200, 300))
+        posters.process(movie)
+        storage = movie.poster.storage
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(storage.exists(posters.current_sizes(other)[160]['jpeg']))
+
+
+class StagedPosterJobTests(MediaRootMixin, TestCase):
+    def stage(self, movie):
+        with self.captureOnCommitCallbacks(execute=True):
+            return posters.stage_upload(movie, SimpleUploadedFile('up.png', _image(400, 600).read()))
+
+    def test_upload_waits_in_the_database_until_the_job_runs(self):
+        movie = _movie()
+        storage = movie.poster.storage
+        job = self.stage(movie)
+        # The request wrote nothing to the poster storage.
+        self.assertFalse(storage.exists('posters'))
+        self.assertEqual(StagedUpload.objects.get(pk=job.kwargs['staged_id']).name, 'up.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(jobs.run(jobs.claim()))
+        movie.refresh_from_db()
+        self.assertTrue(storage.exists(movie.poster.name))
+        self.assertEqual(sorted(posters.current_sizes(movie)), [160, 320, 400])
+        self.assertFalse(StagedUpload.objects.exists())
+        self.assertTrue(CatalogEvent.objects.filter(movie_id=movie.id, kind=CatalogEvent.EDITED).exists())
+        # A retried job finds nothing left to do.
+        posters.store_upload(**job.kwargs)
+        self.assertEqual(Movie.objects.get(pk=movie.pk).poster.name, movie.poster.name)
+
+    def test_upload_for_a_deleted_movie_is_dropped(self):
+        movie = _movie()
+        job = self.stage(movie)
+        movie.delete()
+        self.assertTrue(jobs.run(jobs.claim(job.id)))
+        self.assertFalse(StagedUpload.objects.exists())
+
+    @override_settings(MOVIEHUB_JOBS_INLINE=True)
+    def test_inline_jobs_store_it_after_commit(self):
+        movie = _movie()
+        self.stage(movie)
+        movie.refresh_from_db()
+        self.assertTrue(movie.poster.name)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+
+class RatingRefreshJobTests(TestCase):
+    def setUp(self):
+        recommendations._engine = None
+        self.addCleanup(setattr, recommendations, '_engine', None)
+        self.fan, self.friend = User.objects.create_user('fan'), User.objects.create_user('friend')
+        self.seed, self.pick = _movie('Seed'), _movie('Pick')
+        Rating.objects.create(user=self.friend, movie=self.seed, value=5)
+        Rating.objects.create(user=self.friend, movie=self.pick, value=5)
+        self.run_jobs()
+
+    def run_jobs(self):
+        while jobs.run(jobs.claim()):
+            pass
+
+    def picks(self, user):
+        return list(UserRecommendation.objects.filter(user=user).order_by('rank').values_list('movie_id', flat=True))
+
+    def test_rating_job_stores_new_picks(self):
+        Rating.objects.create(user=self.fan, movie=self.seed, value=5)
+        self.assertEqual(self.picks(self.fan), [])
+        self.run_jobs()
+        self.assertEqual(self.picks(self.fan), [self.pick.id])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_delete_job_drops_picks(self):
+        rating = Rating.objects.create(user=self.fan, movie=self.seed, value=5)
+        self.run_jobs()
+        rating.delete()
+        self.run_jobs()
+        self.assertEqual(self.picks(self.fan), [])
+
+    def test_archive_job_drops_the_movie(self):
+        Rating.objects.create(user=self.fan, movie=self.seed, value=5)
+        self.run_jobs()
+        self.pick.archive()
+        self.run_jobs()
+        self.assertEqual(self.picks(self.fan), [])
+
+    def test_engine_catches_up_on_jobs_it_did_not_run(self):
+        engine = synced_engine()
+        # Written by another process: the job row is there, unrun here.
+        Rating.objects.create(user=self.fan, movie=self.seed, value=5)
+        rating = Rating.objects.get(user=self.friend, movie=self.pick)
+        rating.value = 2
+        rating.save()
+        with self.assertNumQueries(2):
+            self.assertIs(synced_engine(), engine)
+        self.assertEqual(engine.high_water, Job.objects.latest('id').id)
+        self.assertIn(self.seed.id, engine.user_seen[self.fan.id].tolist())
+        self.assertNotIn(self.pick.id, engine.user_likes.get(self.friend.id, []).tolist())
+        with self.assertNumQueries(1):
+            synced_engine()
+
+    def test_reload_job_rebuilds(self):
+        engine = synced_engine()
+        jobs.enqueue(recommendations.reload_engine)
+        self.assertIsNot(synced_engine(), engine)
+
+
+@api
+class TopPicksTests(TestCase):
+    def setUp(self):
+        recommendations._engine = None
+        self.addCleanup(setattr, recommendations, '_engine', None)
+        self.fan, self.friend = User.objects.create_user('fan'), User.objects.create_user('friend')
+        self.seed, self.pick, self.other = _movie('Seed'), _movie('Pick'), _movie('Other')
+        self.write(lambda: [
+            Rating.objects.create(user=self.friend, movie=self.seed, value=5),
+            Rating.objects.create(user=self.friend, movie=self.pick, value=5),
+            Rating.objects.create(user=self.fan, movie=self.seed, value=5),
+        ])
+        self.client.force_login(self.fan)
+
+    def write(self, change):
+        """Run ``change`` and its jobs, with the on-commit token bumps."""
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        with self.captureOnCommitCallbacks(execute=True):
+            while jobs.run(jobs.claim()):
+                pass
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/top-picks/', **headers)
+
+    def test_payload_and_304(self):
+        response = self.get()
+        self.assertEqual([card['id'] for card in response.json()], [self.pick.id])
+        self.assertEqual(response.json()[0]['rating_count'], 1)
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_unrelated_rating_keeps_the_etag(self):
+        etag = self.get()['ETag']
+        stranger = User.objects.create_user('stranger')
+        self.write(lambda: Rating.objects.create(user=stranger, movie=self.other, value=3))
+        self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_rating_a_shown_pick_changes_the_etag(self):
+        etag = self.get()['ETag']
+        stranger = User.objects.create_user('stranger')
+        self.write(lambda: Rating.objects.create(user=stranger, movie=self.pick, value=1))
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['rating_count'], 2)
+
+    def test_own_rating_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.write(lambda: Rating.objects.create(user=self.fan, movie=self.other, value=2))
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_spare_picks_are_not_bumped(self):
+        UserRecommendation.objects.filter(user=self.fan).update(rank=recommendations.TOP_N + 1)
+        before = versions.tokens(versions.RECOMMENDATIONS, [self.fan.id])
+        recommendations.bump_picks_showing([self.pick.id])
+        self.assertEqual(versions.tokens(versions.RECOMMENDATIONS, [self.fan.id]), before)
+        UserRecommendation.objects.filter(user=self.fan).update(rank=1)
+        recommendations.bump_picks_showing([self.pick.id])
+        self.assertNotEqual(versions.tokens(versions.RECOMMENDATIONS, [self.fan.id]), before)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        _movie('A', genre='Drama, Comedy', release_year=1999)
+        _movie('B', genre='Drama', release_year=2001)
+
+    def test_counts_cached_and_invalidated(self):
+        cache.clear()
+        facets = get_facets()
+        self.assertEqual(facets['genres'], [{'name': 'Comedy', 'count': 1}, {'name': 'Drama', 'count': 2}])
+        self.assertEqual([y['year'] for y in facets['years']], [2001, 1999])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_facets(), facets)
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.get(title='A').archive()
+        facets = get_facets()
+        self.assertEqual(facets['genres'], [{'name': 'Drama', 'count': 1}])
+        self.assertEqual(facets['all_genres'][0], {'name': 'Comedy', 'count': 0})
+
+    def test_cache_holds_every_users_tokens(self):
+        # Django's default of 300 entries would cull per-user tokens constantly.
+        self.assertGreaterEqual(getattr(cache, '_max_entries', float('inf')), 100_000)
+
+    def test_bump_all_moves_every_part(self):
+        before = versions.etag(versions.RATINGS, (versions.RATINGS, 1), (versions.RATINGS, 2))
+        versions.bump_all(versions.RATINGS, (versions.RATINGS, 1))
+        after = versions.etag(versions.RATINGS, (versions.RATINGS, 1), (versions.RATINGS, 2))
+        old, new = before.split('-'), after.split('-')
+        self.assertNotEqual(old[0], new[0])
+        self.assertNotEqual(old[1], new[1])
+        self.assertEqual(old[2], new[2])
+
+
+@api
+class CatalogJournalTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('watcher'))
+
+    def changes(self, cursor=''):
+        return self.client.get('/api/movies/changes/', {'cursor': cursor}).json()
+
+    def test_every_change_is_journaled_in_order(self):
+        start = self.changes()['next_cursor']
+        movie = _movie('Journaled')
+        movie.title = 'Journaled, edited'
+        movie.save()
+        movie.archive()
+        movie.restore()
+        movie_id = movie.id
+        movie.delete()
+        data = self.changes(start)
+        self.assertEqual(
+            [(e['movie_id'], e['kind']) for e in data['events']],
+            [(movie_id, kind) for kind in (
+                CatalogEvent.ADDED, CatalogEvent.EDITED, CatalogEvent.ARCHIVED,
+                CatalogEvent.RESTORED, CatalogEvent.DELETED,
+            )],
+        )
+        self.assertEqual(data['movies'], {})
+        self.assertEqual(self.changes(data['next_cursor'])['events'], [])
+
+    def test_cards_only_for_visible_movies(self):
+        shown, hidden = _movie('Shown'), _movie('Hidden')
+        hidden.archive()
+        data = self.changes()
+        self.assertEqual(list(data['movies']), [str(shown.id)])
+        self.assertEqual(data['movies'][str(shown.id)]['title'], 'Shown')
+
+    def test_pages_through_a_long_journal(self):
+        for i in range(5):
+            _movie(f'Movie {i}')
+        seen, cursor = [], 0
+        with mock.patch('moviehub.views.CATALOG_CHANGES_LIMIT', 2):
+            while True:
+                data = self.changes(cursor)
+                seen += [e['seq'] for e in data['events']]
+                cursor = data['next_cursor']
+                if not data['has_more']:
+                    break
+        self.assertEqual(seen, list(CatalogEvent.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_archive_bumps_the_catalog_once(self):
+        movie = _movie()
+        with mock.patch('moviehub.signals.versions.bump') as bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                movie.archive()
+        self.assertEqual(bump.call_args_list, [mock.call(versions.CATALOG)])
+
+
+@api
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def assertNotModifiedUntil(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_polls(self):
+        self.assertNotModifiedUntil('/api/movies/changes/', lambda: _movie('New'))
+        self.assertNotModifiedUntil('/api/movies/updates/', lambda: _movie('Newer'))
+
+    def test_admin_users(self):
+        self.assertNotModifiedUntil('/api/admin/users/', lambda: User.objects.create_user('joined'))
+
+    def test_admin_ratings(self):
+        movie, rater = _movie(), User.objects.create_user('rater')
+        self.assertNotModifiedUntil(
+            '/api/admin/ratings/', lambda: Rating.objects.create(user=rater, movie=movie, value=4),
+        )
+
+    def test_lost_tokens_are_minted_again(self):
+        etag = self.client.get('/api/movies/changes/')['ETag']
+        cache.clear()
+        response = self.client.get('/api/movies/changes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/movies/changes/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_csv_export_is_not_conditional(self):
+        response = self.client.get('/api/admin/ratings/', {'export': 'csv'})
+        self.assertNotIn('ETag', response)
+
+
+class _CountingBackend(events.Backend):
+    def __init__(self):
+        self.runs = 0
+
+    async def run(self, broker):
+        self.runs += 1
+        while broker.active():
+            await asyncio.sleep(0)
+
+
+class EventBrokerTests(SimpleTestCase):
+    def test_backend_must_implement_run(self):
+        with self.assertRaises(TypeError):
+            events.Backend()
+
+    def test_streams_share_one_backend_task(self):
+        backend = _CountingBackend()
+        broker = events.Broker(backend)
+
+        async def scenario():
+            streams = [broker.subscribe(user_id) for user_id in (1, 1, 2)]
+            await asyncio.sleep(0)
+            broker.publish(events.TOP_PICKS, {}, user_id=1)
+            broker.publish(events.CATALOG, {'cursor': 3})
+            received = [[await s.get(0.1), await s.get(0.1)] for s in streams]
+            for stream in streams:
+                broker.unsubscribe(stream)
+            await asyncio.sleep(0)
+            return received
+
+        received = asyncio.run(scenario())
+        self.assertEqual(backend.runs, 1)
+        catalog = events.format_message(events.CATALOG, {'cursor': 3})
+        picks = events.format_message(events.TOP_PICKS, {})
+        self.assertEqual(received, [[picks, catalog], [picks, catalog], [catalog, None]])
+
+
+class JournalBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('watcher')
+        self.backend = events.JournalBackend(interval=1)
+
+    def test_poll_reports_catalog_and_picks_changes(self):
+        self.assertEqual(self.backend.poll([self.user.id]), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            _movie('New')
+        seq = CatalogEvent.objects.latest('id').id
+        self.assertEqual(self.backend.poll([self.user.id]), [(events.CATALOG, {'cursor': seq}, None)])
+        versions.bump(versions.RECOMMENDATIONS, [self.user.id])
+        self.assertEqual(self.backend.poll([self.user.id]), [(events.TOP_PICKS, {}, self.user.id)])
+
+    def test_quiet_poll_is_one_cache_read(self):
+        versions.etag(versions.CATALOG)
+        self.backend.poll([self.user.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.poll([self.user.id]), [])
+
+def _rollups():
+    return list(DailyActivity.objects.values_list('day', 'ratings', 'raters', 'new_users'))
+
+
+class ActivityRollupTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'u{i}') for i in range(3)]
+        self.movies = [_movie(f'Movie {i}') for i in range(3)]
+
+    def test_signals_keep_the_rollup_equal_to_a_rebuild(self):
+        u0, u1, _ = self.users
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Rating.objects.create(user=u0, movie=self.movies[0], value=4)
+            Rating.objects.create(user=u0, movie=self.movies[1], value=2)
+            Rating.objects.create(user=u1, movie=self.movies[0], value=5)
+            first.value = 5
+            first.save()
+        today = timezone.localdate()
+        self.assertEqual(_rollups(), [(today, 3, 2, 3)])
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        rollups = _rollups()
+        activity.rebuild()
+        self.assertEqual(_rollups(), rollups)
+
+    def test_raters_come_from_the_locked_sketch(self):
+        u0 = self.users[0]
+        for movie in self.movies:
+            Rating.objects.create(user=u0, movie=movie, value=3)
+        row = DailyActivity.objects.get()
+        self.assertEqual((row.ratings, row.raters), (3, 1))
+        # A rater already in the sketch is not counted again, whatever the table says.
+        activity.record_rating(Rating(user=u0, created_at=timezone.now()))
+        row.refresh_from_db()
+        self.assertEqual((row.ratings, row.raters), (4, 1))
+
+    def test_series_read_the_rollup(self):
+        now = timezone.now()
+        monday = timezone.localdate(now) - timedelta(days=timezone.localdate(now).weekday())
+
+        def at(day):
+            return timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+
+        u0, u1, u2 = self.users
+        for user, movie, day in [
+            (u0, self.movies[0], monday), (u0, self.movies[1], monday + timedelta(days=1)),
+            (u1, self.movies[0], monday - timedelta(days=7)), (u2, self.movies[2], monday - timedelta(days=7)),
+        ]:
+            rating = Rating.objects.create(user=user, movie=movie, value=4)
+            Rating.objects.filter(pk=rating.pk).update(created_at=at(day))
+        activity.rebuild()
+        when = at(monday + timedelta(days=2))
+        weeks = activity.active_users(activity.WEEKLY, 3, now=when)
+        self.assertEqual([b['start'] for b in weeks], [monday - timedelta(days=14), monday - timedelta(days=7), monday])
+        self.assertEqual([b['count'] for b in weeks], [0, 2, 1])
+        ratings = activity.series(activity.WEEKLY, 3, activity.RATINGS, now=when)
+        self.assertEqual([b['count'] for b in ratings], [0, 2, 2])
+        self.assertEqual(activity.active_users_between(monday - timedelta(days=7), monday + timedelta(days=7)), 3)
+        with self.assertRaises(ValueError):
+            activity.series(activity.WEEKLY, 3, 'nope')
+
+
+class UserSketchTests(SimpleTestCase):
+    def test_bitset_counts_and_merges_exactly(self):
+        a = UserSketch.of([1, 5, 5, 900])
+        self.assertEqual(a.kind, sketches.BITSET)
+        self.assertEqual(a.count(), 3)
+        b = UserSketch.from_bytes(UserSketch.of([5, 7]).to_bytes())
+        self.assertEqual(a.merge(b).count(), 4)
+        self.assertEqual(UserSketch.from_bytes(b'').count(), 0)
+
+    def test_large_ids_switch_to_an_estimate(self):
+        ids = range(sketches.BITSET_MAX_ID, sketches.BITSET_MAX_ID + 50_000)
+        sketch = UserSketch.of(ids)
+        self.assertEqual(sketch.kind, sketches.HLL)
+        self.assertAlmostEqual(sketch.count(), 50_000, delta=50_000 * 0.05)
+        self.assertEqual(UserSketch.from_bytes(sketch.to_bytes()).count(), sketch.count())
+
+    def test_merge_counts_the_union(self):
+        low, high = list(range(1, 1001)), list(range(500, 40_500))
+        merged = merged_count([UserSketch.of(low).to_bytes(), UserSketch.of(high).to_bytes(), b''])
+        self.assertAlmostEqual(merged, 40_500, delta=40_500 * 0.05)
+        # Adding ids one at a time ends up with the same registers as adding them at once.
+        one_by_one = UserSketch()
+        for user_id in high[-3000:]:
+            one_by_one.add([user_id])
+        self.assertEqual(one_by_one.to_bytes(), UserSketch.of(high[-3000:]).to_bytes())
+
+
+class ImportMoviesTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        _movie('Known', release_year=2000)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        with open(f'{self.dir}/new.png', 'wb') as f:
+            f.write(_image(400, 600).read())
+
+    def write(self, rows):
+        path = f'{self.dir}/movies.csv'
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['title', 'genre', 'release_year', 'description', 'poster'])
+            writer.writerows(rows)
+        return path
+
+    def test_imports_new_movies_once(self):
+        path = self.write([
+            ['Known', 'Drama', '2000', '', ''],
+            ['New', 'Drama, Comedy', '2001', 'Fresh', 'new.png'],
+            ['New', 'Drama', '2001', '', ''],
+            ['Broken', 'Drama', 'soon', '', ''],
+            ['Third', 'Horror', '2002', '', ''],
+        ])
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_movies', path, posters=self.dir, batch_size=2, workers=1, stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 2 movie(s)', out.getvalue())
+        self.assertIn('skipped 2 duplicate(s) and 1 invalid row(s)', out.getvalue())
+        self.assertFalse([q['sql'] for q in queries if '"title" IN' in q['sql']])
+        new = Movie.objects.get(title='New')
+        self.assertEqual(sorted(new.genres.values_list('slug', flat=True)), ['comedy', 'drama'])
+        self.assertEqual(sorted(posters.current_sizes(new)), [160, 320, 400])
+        kinds = CatalogEvent.objects.filter(movie_id=new.id).values_list('kind', flat=True)
+        self.assertEqual(sorted(kinds), sorted([CatalogEvent.ADDED, CatalogEvent.EDITED]))
+        self.assertEqual(Movie.objects.filter(title='Known').count(), 1)
+
+    def test_failed_batch_still_records_stored_posters(self):
+        path = self.write([['New', 'Drama', '2001', '', 'new.png'], ['Later', 'Drama', '2002', '', '']])
+        command = 'moviehub.management.commands.import_movies.Command'
+        link_genres = import_movies.Command._link_genres
+
+        def fail_second(self, movies):
+            if movies[0].title == 'Later':
+                raise RuntimeError('database went away')
+            return link_genres(self, movies)
+
+        with mock.patch(f'{command}._link_genres', fail_second), self.assertRaises(RuntimeError):
+            call_command('import_movies', path, posters=self.dir, batch_size=1, workers=1, stdout=io.StringIO())
+        self.assertFalse(Movie.objects.filter(title='Later').exists())
+        self.assertTrue(Movie.objects.get(title='New').poster.name)
+
+
+class RatingsImportExportTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        self.first, self.second = _movie('First'), _movie('Second')
+        Rating.objects.create(user=self.alice, movie=self.first, value=2)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def test_import_upserts_and_rebuilds_what_signals_would_keep(self):
+        path = f'{self.dir}/ratings.csv'
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['user', 'user_id', 'movie', 'value', 'created_at'])
+            writer.writerows([
+                ['alice', '', self.first.id, 5, '2024-03-01T12:00:00'],
+                ['', self.bob.id, self.second.id, 4, '2024-03-02'],
+                ['bob', '', self.first.id, 3, ''],
+                ['nobody', '', self.first.id, 3, ''],
+                ['alice', '', 999999, 3, ''],
+                ['alice', '', self.second.id, 9, ''],
+            ])
+        out = io.StringIO()
+        call_command('import_ratings', path, batch_size=2, skip_recommendations=True, stdout=out, stderr=io.StringIO())
+        self.assertIn('Wrote 3 rating(s)', out.getvalue())
+        self.assertIn('skipped 2 for unknown users or movies and 1 invalid row(s)', out.getvalue())
+        values = dict(((r.user.username, r.movie.title), r.value) for r in Rating.objects.select_related('user', 'movie'))
+        self.assertEqual(values, {('alice', 'First'): 5, ('bob', 'Second'): 4, ('bob', 'First'): 3})
+        dated = Rating.objects.get(user=self.alice)
+        self.assertEqual(timezone.localdate(dated.created_at), datetime.date(2024, 3, 1))
+        self.assertFalse(drifted_movies().exists())
+        self.assertTrue(DailyActivity.objects.filter(day=datetime.date(2024, 3, 2), raters=1).exists())
+        self.assertTrue(Job.objects.filter(task=jobs.task_path(recommendations.reload_engine)).exists())
+
+    def test_export_round_trips(self):
+        Rating.objects.create(user=self.bob, movie=self.second, value=4)
+        for name in ('ratings.csv', 'ratings.jsonl'):
+            path = f'{self.dir}/{name}'
+            call_command('export_ratings', output=path, batch_size=1, stdout=io.StringIO())
+            before = list(Rating.objects.order_by('id').values_list('user_id', 'movie_id', 'value', 'created_at'))
+            call_command('import_ratings', path, skip_recommendations=True, stdout=io.StringIO())
+            after = list(Rating.objects.order_by('id').values_list('user_id', 'movie_id', 'value', 'created_at'))
+            self.assertEqual(after, before)
+        with open(f'{self.dir}/ratings.csv', newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(r['user'], r['value']) for r in rows], [('alice', '2'), ('bob', '4')])
+
+
+class DeleteOldArchivedMoviesTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'u{i}') for i in range(30)]
+        self.old, self.recent, self.kept = _movie('Old'), _movie('Recent'), _movie('Kept')
+        for movie in (self.old, self.recent, self.kept):
+            Rating.objects.bulk_create([Rating(user=u, movie=movie, value=4) for u in self.users])
+        recompute_rating_aggregates()
+        activity.rebuild()
+        long_ago = timezone.now() - timedelta(days=40)
+        Movie.objects.filter(pk=self.old.pk).update(archived_at=long_ago)
+        Movie.objects.filter(pk=self.recent.pk).update(archived_at=timezone.now())
+
+    def purge(self, **options):
+        out = io.StringIO()
+        with mock.patch('moviehub.management.commands.delete_old_archived_movies.RATING_CHUNK', 7):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('delete_old_archived_movies', stdout=out, **options)
+        return out.getvalue()
+
+    def test_deletes_only_movies_past_retention(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.purge()
+        self.assertIn('Successfully deleted 1 archived movie(s) and 30 rating(s)', output)
+        self.assertEqual(set(Movie.objects.values_list('title', flat=True)), {'Recent', 'Kept'})
+        self.assertEqual(Rating.objects.count(), 60)
+        # Raw slices of 7: five DELETEs, and no aggregate UPDATE per rating.
+        sql = [q['sql'] for q in queries]
+        self.assertEqual(len([s for s in sql if s.startswith('DELETE FROM "moviehub_rating"')]), 5)
+        self.assertFalse([s for s in sql if s.startswith('UPDATE "moviehub_movie"')])
+
+    def test_bookkeeping_matches_a_rebuild(self):
+        self.purge()
+        self.assertFalse(drifted_movies().exists())
+        rollups = _rollups()
+        activity.rebuild()
+        self.assertEqual(_rollups(), rollups)
+        self.assertTrue(CatalogEvent.objects.filter(movie_id=self.old.id, kind=CatalogEvent.DELETED).exists())
+        removed = Job.objects.filter(task=jobs.task_path(recommendations.refresh_after_ratings_removed))
+        self.assertEqual(sum(len(job.kwargs['pairs']) for job in removed), 30)
+
+    def test_dry_run_and_resume(self):
+        output = self.purge(dry_run=True)
+        self.assertIn('Would delete 1 archived movie(s) and their 30 rating(s)', output)
+        self.assertIn('Stopped after 0s with 1 movie(s) left', self.purge(max_runtime=0))
+        self.assertTrue(Movie.objects.filter(pk=self.old.pk).exists())
+        self.purge()
+        self.assertFalse(Movie.objects.filter(pk=self.old.pk).exists())
 
-# Create your tests here.
@@ -27,8 +27,12 @@ urlpatterns = [
     
     # API endpoints
     path('api/movies/updates/', views.movies_updates_api, name='movies_updates'),
+    path('api/events/', views.events_stream, name='events_stream'),
+    path('api/movies/changes/', views.movies_changes_api, name='movies_changes'),
+    path('api/movies/page/', views.movies_page_api, name='movies_page'),
     path('api/admin/archived_movies/', views.admin_archived_movies_api, name='admin_archived_movies'),
     path('api/admin/movie/<int:movie_id>/', views.admin_movie_api, name='admin_movie_api'),
+    path('api/admin/jobs/<int:job_id>/', views.admin_job_api, name='admin_job_api'),
     path('api/admin/users/', views.admin_users_api, name='admin_users_api'),
     path('api/admin/ratings/', views.admin_ratings_api, name='admin_ratings_api'),
     path('api/movies/is_recommended/', views.movie_recommendation_status, name='movie_recommendation_status'),
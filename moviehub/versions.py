@@ -0,0 +1,145 @@
+"""Version tokens for conditional GETs on the polled JSON endpoints.
+
+Each token names a piece of state a response depends on and changes whenever
+that state does. Tokens live in the shared cache, so every worker agrees on
+them, and are bumped by the signal handlers after the write commits:
+
+- ``CATALOG``: any movie saved, archived, restored or deleted
+- ``RATINGS``: any rating added, changed or removed
+- ``RATINGS`` (per user): one of that user's own ratings changed
+- ``USERS``: any user saved or deleted
+- ``RECOMMENDATIONS`` (per user): that user's stored picks were rewritten, or
+  the rating average of one shown in their Top Picks moved (bumped by the
+  rating jobs rather than after the write)
+
+``etag(...)`` combines tokens with a single cache read, so a poll that ends in
+``304 Not Modified`` costs one indexed lookup and nothing else. A token that
+is missing (never set, evicted, or the cache was cleared) is simply minted
+again, which makes clients refetch once.
+
+``lookup`` / ``remember`` keep a response body next to the ETag it was built
+for. The same single read returns both, and a bumped token makes the body
+stale without anything having to delete it.
+"""
+import uuid
+
+from django.core.cache import cache
+
+CATALOG = 'catalog'
+RATINGS = 'ratings'
+USERS = 'users'
+RECOMMENDATIONS = 'recommendations'
+
+_PREFIX = 'moviehub:version:'
+
+
+def _key(name, scope=None):
+    return f'{_PREFIX}{name}' if scope is None else f'{_PREFIX}{name}:{scope}'
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def bump(name, scopes=None):
+    """Give ``name`` (or ``name`` for each of ``scopes``) a new token."""
+    if scopes is None:
+        bump_all(name)
+    else:
+        bump_all(*((name, scope) for scope in scopes))
+
+
+def bump_all(*parts):
+    """Give each of ``parts`` (names or ``(name, scope)`` pairs, as for ``etag``) a new token.
+
+    One ``set_many`` call, so write paths that move several tokens should
+    bump them together.
+    """
+    keys = _keys(parts)
+    if not keys:
+        return
+    try:
+        cache.set_many({key: _token() for key in keys}, timeout=None)
+    except Exception:
+        # Cache unavailable: conditional GETs just stop matching.
+        pass
+
+
+def peek(*parts):
+    """Current tokens of ``parts`` (as for ``etag``) in one read, without minting any.
+
+    Returns ``{part: token or None}``, or None if the cache cannot be read.
+    """
+    keys = _keys(parts)
+    try:
+        found = cache.get_many(keys)
+    except Exception:
+        return None
+    return {part: found.get(key) for part, key in zip(parts, keys)}
+
+
+def tokens(name, scopes):
+    """Current token of ``name`` for each of ``scopes``, without minting any.
+
+    Returns ``{scope: token or None}``, or None if the cache cannot be read.
+    """
+    found = peek(*((name, scope) for scope in scopes))
+    if found is None:
+        return None
+    return {scope: token for (_, scope), token in found.items()}
+
+
+def _current(keys, extra=()):
+    """Tokens for ``keys`` (minting missing ones) plus ``extra`` keys, in one read."""
+    found = cache.get_many(list(keys) + list(extra))
+    missing = {key: _token() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return found
+
+
+def _keys(parts):
+    return [_key(*part) if isinstance(part, tuple) else _key(part) for part in parts]
+
+
+def etag(*parts):
+    """Combine the current tokens of ``parts`` into an ETag value.
+
+    Each part is a name or a ``(name, scope)`` pair. Returns None (no
+    conditional handling) if the cache cannot be read.
+    """
+    keys = _keys(parts)
+    try:
+        tokens = _current(keys)
+    except Exception:
+        return None
+    return '-'.join(tokens[key] for key in keys)
+
+
+def lookup(key, *parts):
+    """``(etag(*parts), value)`` from a single cache read.
+
+    ``value`` is what ``remember`` stored under ``key`` for this same ETag,
+    or None when nothing was stored or the state has changed since.
+    """
+    keys = _keys(parts)
+    try:
+        found = _current(keys, extra=[key])
+    except Exception:
+        return None, None
+    tag = '-'.join(found[k] for k in keys)
+    stored = found.get(key)
+    if stored and stored[0] == tag:
+        return tag, stored[1]
+    return tag, None
+
+
+def remember(key, tag, value, timeout=60 * 60 * 24):
+    """Store ``value`` under ``key`` for as long as the ETag stays ``tag``."""
+    if tag is None:
+        return
+    try:
+        cache.set(key, (tag, value), timeout)
+    except Exception:
+        pass
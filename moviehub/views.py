@@ -1,33 +1,42 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm
 from django.contrib.auth import login, logout, update_session_auth_hash
-from .models import Movie, UserProfile
+from .models import CatalogEvent, Job, Movie, UserProfile, parse_genres
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from .models import Rating, Movie
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from .recommendations import get_recommendations
+from .recommendations import get_precomputed_recommendations
+from .aggregates import top_rated as top_rated_movies
+from .pagination import movie_page, parse_cursor, parse_page_size, timestamp_page
+from . import activity, events, posters, schema, search, versions
+from .facets import get_facets
 from django.db.models import Q
 from django.contrib.auth.decorators import user_passes_test
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+import asyncio
+import csv
 import datetime
 import json
 from django.utils import timezone
-from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+from django.db.models import Avg, Count, F, Max
 from django.core.mail import send_mail
 from django.conf import settings
 import random
 import string
 from django.views.decorators.http import require_POST
 from django.db.models.functions import TruncDay, TruncMonth
-from django.db import connection
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import condition, require_GET
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
 from django.middleware.csrf import get_token
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 
 
@@ -143,76 +152,93 @@ def logout_view(request):
     logout(request)
     return redirect('login')
 
+def _filtered_movies(selected_genre):
+    """Non-archived movies matching the dashboard genre filter.
+
+    The search box is applied separately by `_grid_page` / `search.ranked`,
+    which also decide the ordering.
+    """
+    movies = Movie.objects.filter(archived_at__isnull=True)
+
+    # Apply genre filter if provided: an indexed join through the normalized
+    # Genre table rather than a substring scan of the `genre` CharField.
+    if selected_genre:
+        movies = movies.filter(genres__slug=selected_genre.lower())
+    return movies
+
+
+def _grid_page(movies, query, cursor=None):
+    """One page of the dashboard grid: newest first, or by relevance when searching."""
+    if search.tokenize(query):
+        return search.search_page(movies, query, cursor=cursor)
+    return movie_page(movies, cursor=parse_cursor(cursor))
+
+
+def _movie_card_payload(movie, user_ratings=None):
+    """JSON shape used by the dashboard's client-side createMovieCard()."""
+    poster_url = ''
+    try:
+        if movie.poster:
+            poster_url = movie.poster.url
+    except Exception:
+        poster_url = ''
+    return {
+        'id': movie.id,
+        'title': movie.title,
+        'genre': movie.genre or '',
+        'release_year': movie.release_year or '',
+        'description': movie.description or '',
+        'poster': poster_url,
+        'poster_srcset': {fmt: posters.srcset(movie, fmt) for fmt in posters.FORMATS},
+        'average_rating': movie.average_rating(),
+        'user_rating': (user_ratings or {}).get(movie.id),
+    }
+
+
+def _user_ratings_for(user, movies):
+    """The user's own rating for each of `movies` (only the rows on screen)."""
+    if not user.is_authenticated or not movies:
+        return {}
+    return dict(
+        Rating.objects.filter(user=user, movie_id__in=[m.id for m in movies])
+        .values_list('movie_id', 'value')
+    )
+
+
 @login_required(login_url='login')
 def dashboard_view(request):
     query = (request.GET.get('q') or '').strip()
     selected_genre = (request.GET.get('genre') or '').strip()
-    if query:
-        # Split query into tokens so multi-word searches match titles in any order
-        tokens = [t for t in query.split() if t]
-        if tokens:
-            q_objects = Q()
-            # Require each token to appear in title OR genre (AND across tokens)
-            for token in tokens:
-                token_q = Q(title__icontains=token) | Q(genre__icontains=token)
-                q_objects &= token_q
-            movies = Movie.objects.filter(q_objects, archived_at__isnull=True).distinct()
-        else:
-            movies = Movie.objects.all()
-    else:
-        movies = Movie.objects.filter(archived_at__isnull=True)
-
-    # Apply genre filter if provided. Movies may have multiple genres stored
-    # in the `genre` CharField (comma-separated). We do a case-insensitive
-    # contains match so that partial/combined genre strings still match.
-    if selected_genre:
-        movies = movies.filter(genre__icontains=selected_genre)
+    movies = _filtered_movies(selected_genre)
 
     # Compute top picks safely: avoid querying Rating model if DB migrations
     # haven't added the new `created_at` column yet. When created_at is
     # missing, skip rating-based computations to prevent OperationalError.
-    def _table_has_column(model, column_name):
-        try:
-            table_name = model._meta.db_table
-            with connection.cursor() as cursor:
-                cols = [c.name for c in connection.introspection.get_table_description(cursor, table_name)]
-            return column_name in cols
-        except Exception:
-            return False
-
-    rating_table_ok = _table_has_column(Rating, 'created_at')
+    rating_table_ok = schema.ratings_ready()
 
     if rating_table_ok:
-        top_rated = sorted(movies, key=lambda m: m.average_rating(), reverse=True)[:5]
+        top_rated = top_rated_movies(search.ranked(movies, query), limit=5)
     else:
         # Fallback: just take first 5 movies when ratings can't be queried
-        top_rated = list(movies[:5])
+        top_rated = list(search.ranked(movies, query)[:5])
 
-    user_ratings = {}
     recommended_movies = []
     if request.user.is_authenticated and rating_table_ok:
         try:
-            ratings = Rating.objects.filter(user=request.user)
-            user_ratings = {r.movie.id: r.value for r in ratings}
-            recommended_movies = get_recommendations(request.user)
+            recommended_movies = get_precomputed_recommendations(request.user)
         except Exception:
-            user_ratings = {}
             recommended_movies = []
 
-    # If a search query is active, filter recommended movies to only those matching the search
+    # If a search query is active, keep only the picks that match it, best match first
     if query and recommended_movies:
-        tokens = [t for t in query.split() if t]
-        filtered_recs = []
-        for m in recommended_movies:
-            # Check if all tokens appear in title or genre
-            matches = all(token.lower() in (m.title or '').lower() or token.lower() in (m.genre or '').lower() for token in tokens)
-            if matches:
-                filtered_recs.append(m)
-        recommended_movies = filtered_recs
+        recommended_movies = search.rank_among(recommended_movies, query)
 
     # If a genre is selected, also filter recommended movies list
     if selected_genre and recommended_movies:
-        recommended_movies = [m for m in recommended_movies if selected_genre.lower() in (m.genre or '').lower()]
+        recommended_movies = [
+            m for m in recommended_movies
+            if selected_genre.lower() in {g.lower() for g in parse_genres(m.genre)}
+        ]
 
     # Show the one-time welcome notification if set in session (set during login)
     show_welcome = False
@@ -221,43 +247,28 @@ def dashboard_view(request):
     except Exception:
         show_welcome = False
 
-    # Build a list of available genres (split by comma) from all movies so
-    # the template can render a filter dropdown. Normalize and dedupe.
-    all_genres = set()
-    for m in Movie.objects.filter(archived_at__isnull=True):
-        if m.genre:
-            parts = [p.strip().replace('-', '') for p in m.genre.split(',') if p.strip()]
-            for p in parts:
-                all_genres.add(p)
-
-    genres = sorted(all_genres)
-
-    # Ensure recommended movies appear in the 'movies' list so "Top Picks"
-    # are also visible in "All Movies". This keeps the UI consistent when
-    # filters or queries would otherwise hide recommended items.
-    # However, when searching, only include recommended movies that match the search.
-    try:
-        # Convert queryset to list for safe mutation
-        movies_list = list(movies) if not isinstance(movies, list) else movies
-        existing_ids = {m.id for m in movies_list if getattr(m, 'id', None) is not None}
-        if recommended_movies:
-            for rm in recommended_movies:
-                if getattr(rm, 'id', None) and rm.id not in existing_ids:
-                    # When searching or filtering by genre, only add recommended movies
-                    # that are already in the search/filter results
-                    if query or selected_genre:
-                        # Skip: only add if already in movies_list (which was filtered by search)
-                        continue
-                    # No search/genre filter: insert all recommended items near the top
-                    movies_list.insert(0, rm)
-                    existing_ids.add(rm.id)
-        movies = movies_list
-    except Exception:
-        # Fail safely: keep original `movies` queryset if anything goes wrong
-        pass
+    # Genres used by at least one visible movie, for the filter dropdown
+    genres = [g['name'] for g in get_facets()['genres']]
+
+    # Only the first page of the grid is rendered here; the client fetches
+    # further pages from `movies_page_api` using `next_cursor`. Top Picks stay
+    # in their own row rather than being merged into the grid.
+    page, next_cursor = _grid_page(movies, query)
+
+    user_ratings = {}
+    if rating_table_ok:
+        try:
+            user_ratings = _user_ratings_for(request.user, page + recommended_movies)
+        except Exception:
+            user_ratings = {}
+
+    # Changes after this point reach the page through `movies_changes_api`.
+    catalog_cursor = CatalogEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
 
     return render(request, 'pages/dashboard.html', {
-        'movies': movies,
+        'movies': page,
+        'next_cursor': next_cursor,
+        'catalog_cursor': catalog_cursor,
         'top_rated': top_rated,
         'user_ratings': user_ratings,
         'recommended_movies': recommended_movies,
@@ -266,6 +277,120 @@ def dashboard_view(request):
         'selected_genre': selected_genre,
     })
 
+
+@login_required(login_url='login')
+@require_GET
+def movies_page_api(request):
+    """Return one page of the dashboard movie grid.
+
+    Query params:
+    - cursor: `next_cursor` from the previous page (omit for the first page)
+    - q, genre: the same search and genre filters as the dashboard
+
+    Without `q` the grid is newest first; with `q` it is ordered by search
+    relevance and the cursor is an opaque string.
+
+    Returns {"results": [...], "next_cursor": int|str|null}.
+    """
+    query = (request.GET.get('q') or '').strip()
+    selected_genre = (request.GET.get('genre') or '').strip()
+
+    movies, next_cursor = _grid_page(_filtered_movies(selected_genre), query, request.GET.get('cursor'))
+    user_ratings = _user_ratings_for(request.user, movies)
+    return JsonResponse({
+        'results': [_movie_card_payload(m, user_ratings) for m in movies],
+        'next_cursor': next_cursor,
+    })
+
+
+CATALOG_CHANGES_LIMIT = 200
+
+
+def _catalog_etag(request, *args, **kwargs):
+    return versions.etag(versions.CATALOG)
+
+
+@login_required(login_url='login')
+@require_GET
+@condition(etag_func=_catalog_etag)
+@cache_control(private=True, no_cache=True)
+def movies_changes_api(request):
+    """Catalog changes since `cursor`, read from the CatalogEvent journal.
+
+    Query params:
+    - cursor: `next_cursor` from the previous call (or `catalog_cursor` from
+      the dashboard); omit to read from the start of the journal
+
+    Returns {"events": [{"seq", "movie_id", "kind"}, ...], "movies": {id:
+    card payload}, "next_cursor": int, "has_more": bool}. Events are oldest
+    first and must be applied in order. `movies` holds the current card for
+    every movie in `events` that is still visible.
+    """
+    cursor = parse_cursor(request.GET.get('cursor')) or 0
+    events = list(
+        CatalogEvent.objects.filter(id__gt=cursor)
+        .order_by('id')
+        .values_list('id', 'movie_id', 'kind')[:CATALOG_CHANGES_LIMIT + 1]
+    )
+    has_more = len(events) > CATALOG_CHANGES_LIMIT
+    events = events[:CATALOG_CHANGES_LIMIT]
+
+    shown = {movie_id for _, movie_id, kind in events if kind not in (CatalogEvent.ARCHIVED, CatalogEvent.DELETED)}
+    movies = list(Movie.objects.filter(id__in=shown, archived_at__isnull=True)) if shown else []
+    user_ratings = _user_ratings_for(request.user, movies)
+    return JsonResponse({
+        'events': [{'seq': seq, 'movie_id': movie_id, 'kind': kind} for seq, movie_id, kind in events],
+        'movies': {m.id: _movie_card_payload(m, user_ratings) for m in movies},
+        'next_cursor': events[-1][0] if events else cursor,
+        'has_more': has_more,
+    })
+
+
+# Streams are closed after this long and the browser reconnects, so a stream
+# whose client vanished without a disconnect is never held for long.
+EVENT_STREAM_LIFETIME = 300
+EVENT_STREAM_KEEPALIVE = 15
+
+
+def _stream_user_id(request):
+    return request.user.id if request.user.is_authenticated else None
+
+
+async def events_stream(request):
+    """Server-sent events for the dashboard (see moviehub.events).
+
+    Only served under ASGI. Under WSGI a stream would tie up a worker
+    thread, so the endpoint answers 204, which tells EventSource not to
+    reconnect and leaves the page on its polling fallback.
+    """
+    # Written out rather than decorated: Django 4.2's view decorators are sync-only.
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user_id = await sync_to_async(_stream_user_id)(request)
+    if user_id is None:
+        return JsonResponse({'error': 'authentication required'}, status=401)
+
+    broker = events.get_broker()
+    subscription = broker.subscribe(user_id)
+
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + EVENT_STREAM_LIFETIME
+            while loop.time() < deadline:
+                message = await subscription.get(EVENT_STREAM_KEEPALIVE)
+                yield message or ': keep-alive\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def home_redirect(request):
     return redirect('dashboard')
 
@@ -275,11 +400,13 @@ def rate_movie_view(request, movie_id):
     if request.method == "POST":
         value = int(request.POST.get(f'rating_{movie.id}', 0))
         try:
-            rating, created = Rating.objects.get_or_create(user=request.user, movie=movie)
-            rating.value = value
-            rating.save()
+            rating, created = Rating.objects.update_or_create(
+                user=request.user, movie=movie, defaults={'value': value}
+            )
             # If this was an AJAX/fetch request, return JSON so client can handle it
             if request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest':
+                # Aggregates were bumped in the database by the Rating signal
+                movie.refresh_from_db(fields=['rating_sum', 'rating_count'])
                 # Return both the user's rating and the new average rating
                 return JsonResponse({
                     'status': 'ok',
@@ -301,6 +428,19 @@ def is_admin(user):
     return user.is_superuser or user.is_staff
 
 
+def _admin_rating_summary():
+    """First page of the admin ratings table plus overall count and average."""
+    if not schema.ratings_ready():
+        return [], None, 0, 0
+    try:
+        rows, next_cursor = timestamp_page(_admin_rating_rows(), 'created_at')
+        totals = Rating.objects.aggregate(total=Count('id'), average=Avg('value'))
+        avg_rating = round(totals['average'], 1) if totals['average'] is not None else 0
+        return [_admin_rating_payload(row) for row in rows], next_cursor, totals['total'], avg_rating
+    except Exception:
+        return [], None, 0, 0
+
+
 @ensure_csrf_cookie
 @login_required(login_url='login')
 @user_passes_test(is_admin, login_url='login')
@@ -316,7 +456,7 @@ def admin_dashboard(request):
     # Show only non-archived movies
     movies = Movie.objects.filter(archived_at__isnull=True).order_by('-id')
     if admin_genre:
-        movies = movies.filter(genre__icontains=admin_genre)
+        movies = movies.filter(genres__slug=admin_genre.lower())
     if admin_year:
         try:
             movies = movies.filter(release_year=int(admin_year))
@@ -326,113 +466,60 @@ def admin_dashboard(request):
     # Get archived movies for archive section
     archived_movies = Movie.objects.filter(archived_at__isnull=False).order_by('-archived_at')
     
-    users = User.objects.filter(is_superuser=False, is_staff=False)  # Only show regular users
+    # Only show regular users; the first page here, the rest via `admin_users_api`
+    users, users_cursor = timestamp_page(_admin_user_rows(), 'date_joined')
+    users_total = User.objects.filter(is_superuser=False, is_staff=False).count()
     # Safely fetch ratings: if the DB lacks the `created_at` column (migrations
-    # not applied), avoid querying Rating to prevent OperationalError.
-    def _table_has_column(model, column_name):
-        try:
-            table_name = model._meta.db_table
-            with connection.cursor() as cursor:
-                cols = [c.name for c in connection.introspection.get_table_description(cursor, table_name)]
-            return column_name in cols
-        except Exception:
-            return False
+    # not applied), avoid querying Rating to prevent OperationalError. Only the
+    # newest page is rendered; the table pages through `admin_ratings_api`.
+    ratings, ratings_cursor, ratings_total, avg_rating = _admin_rating_summary()
 
-    ratings = []
-    if _table_has_column(Rating, 'created_at'):
-        try:
-            ratings = list(Rating.objects.all())
-        except Exception:
-            ratings = []
-    
-    # Calculate average rating (handle ratings as queryset or list)
-    try:
-        if hasattr(ratings, 'exists'):
-            if ratings.exists():
-                avg_rating = round(sum(r.value for r in ratings) / ratings.count(), 1)
-            else:
-                avg_rating = 0
-        else:
-            # ratings is a list
-            if ratings:
-                avg_rating = round(sum(r.value for r in ratings) / len(ratings), 1)
-            else:
-                avg_rating = 0
-    except Exception:
-        avg_rating = 0
-    
     # Provide admin's profile (if any) to prefill admin profile form
     profile, _ = UserProfile.objects.get_or_create(user=request.user)
 
-    # Prepare available genres and years for admin filters (from all movies)
-    all_genres = set()
-    for m in Movie.objects.all():
-        if m.genre:
-            parts = [p.strip().replace('-', '') for p in m.genre.split(',') if p.strip()]
-            for p in parts:
-                all_genres.add(p)
-    available_genres = sorted(all_genres)
-
-    available_years = sorted({m.release_year for m in Movie.objects.filter(archived_at__isnull=True) if m.release_year}, reverse=True)
+    # Prepare available genres and years (with movie counts) for admin filters
+    facets = get_facets()
+    available_genres = facets['all_genres']
+    available_years = facets['years']
 
     # STATISTICS: rating activity chart data
     stats_range = request.GET.get('stats_range', 'weekly')  # weekly, monthly, yearly
     # We default to counting active users (unique users who rated in the period).
-    stats_metric = request.GET.get('stats_metric', 'active_users')  # kept for compatibility but default is active_users
+    stats_metric = request.GET.get('stats_metric', 'active_users')
+    if stats_metric not in (activity.ACTIVE_USERS,) + activity.ROLLUP_METRICS:
+        stats_metric = activity.ACTIVE_USERS
     now = timezone.now()
     stats_labels = []
     stats_data = []
 
     try:
         # Only run aggregation if the DB table has the 'created_at' column (migrations applied)
-        table_name = Rating._meta.db_table
-        with connection.cursor() as cursor:
-            cols = [c.name for c in connection.introspection.get_table_description(cursor, table_name)]
-
-        if 'created_at' in cols:
-            # Build counts per requested range. We will compute raw counts (distinct active users)
-            # and a presence flag (1 if count>0 else 0). Monthly now shows last 3 months; yearly last 3 years.
+        if schema.ratings_ready():
+            # One value per bucket (distinct active users by default; ratings or
+            # new users from the daily rollup), all bars from one grouped query.
+            # Weekly shows the last 4 weeks (Mon-Sun); monthly the last 3
+            # calendar months; yearly the last 3 calendar years. Oldest first.
             if stats_range == 'weekly':
-                # Last 4 weeks (week = Mon-Sun). Show 4 bars, oldest -> newest.
-                current_monday = (now.date() - datetime.timedelta(days=now.weekday()))
-                for i in range(3, -1, -1):
-                    week_start = current_monday - datetime.timedelta(weeks=i)
-                    week_end = week_start + datetime.timedelta(days=6)
-                    # Count distinct active users who rated in this week
-                    count = Rating.objects.filter(created_at__date__gte=week_start, created_at__date__lte=week_end).values('user').distinct().count()
+                for bucket in activity.series(activity.WEEKLY, 4, stats_metric, now=now):
+                    week_start, week_end = bucket['start'], bucket['end'] - datetime.timedelta(days=1)
                     # Format label with dates (e.g., "Nov 10 - Nov 16, 2025")
                     if week_start.year == week_end.year:
                         label = f"{week_start.strftime('%b %d')} - {week_end.strftime('%b %d, %Y')}"
                     else:
                         label = f"{week_start.strftime('%b %d, %Y')} - {week_end.strftime('%b %d, %Y')}"
                     stats_labels.append(label)
-                    stats_data.append(count)
+                    stats_data.append(bucket['count'])
 
             elif stats_range == 'monthly':
-                # Last 3 months (calendar months). Show 3 bars, oldest -> newest.
-                first_of_month = datetime.date(now.year, now.month, 1)
-
-                def month_shift(dt, shift):
-                    year = dt.year + ((dt.month - 1 + shift) // 12)
-                    month = (dt.month - 1 + shift) % 12 + 1
-                    return datetime.date(year, month, 1)
-
-                for i in range(2, -1, -1):
-                    m = month_shift(first_of_month, -i)
-                    # Count distinct active users who rated in this month
-                    c = Rating.objects.filter(created_at__year=m.year, created_at__month=m.month).values('user').distinct().count()
+                for bucket in activity.series(activity.MONTHLY, 3, stats_metric, now=now):
                     # Format label (e.g., "November 2025")
-                    label = m.strftime('%B %Y')
-                    stats_labels.append(label)
-                    stats_data.append(c)
+                    stats_labels.append(bucket['start'].strftime('%B %Y'))
+                    stats_data.append(bucket['count'])
 
             else:  # yearly
-                # Last 3 years (calendar years). Show 3 bars, oldest -> newest.
-                for i in range(2, -1, -1):
-                    y = now.year - i
-                    c = Rating.objects.filter(created_at__year=y).values('user').distinct().count()
-                    stats_labels.append(str(y))
-                    stats_data.append(c)
+                for bucket in activity.series(activity.YEARLY, 3, stats_metric, now=now):
+                    stats_labels.append(str(bucket['start'].year))
+                    stats_data.append(bucket['count'])
         else:
             # migrations not applied yet or column missing; leave empty
             stats_labels = []
@@ -470,7 +557,11 @@ def admin_dashboard(request):
         'movies': list(movies),
         'archived_movies': list(archived_movies),
         'ratings': ratings,
+        'ratings_cursor': ratings_cursor,
+        'ratings_total': ratings_total,
         'users': users,
+        'users_cursor': users_cursor,
+        'users_total': users_total,
         'avg_rating': avg_rating,
         'profile': profile,
         'stats_labels': stats_labels_json,
@@ -493,49 +584,63 @@ def csrf_token_view(request):
     return JsonResponse({'csrfToken': token})
 
 
+def _parse_movie_ids(request):
+    """Ids from `movie_ids` (comma-separated or repeated) and/or `movie_id`."""
+    raw = request.GET.getlist('movie_ids') + request.GET.getlist('movie_id')
+    ids = []
+    for value in raw:
+        for part in value.split(','):
+            try:
+                ids.append(int(part))
+            except ValueError:
+                continue
+    return list(dict.fromkeys(ids))
+
+
 @require_GET
 def movie_recommendation_status(request):
-    """Return whether the given movie_id is recommended for the current user.
+    """Return whether the given movies are recommended for the current user.
 
     Useful for client-side logic to decide whether a restored movie should
     appear in the Top Picks section for this user.
-    """
-    movie_id = request.GET.get('movie_id')
-    try:
-        movie_id = int(movie_id)
-    except Exception:
-        return JsonResponse({'recommended': False})
 
-    if not request.user or not request.user.is_authenticated:
-        return JsonResponse({'recommended': False})
+    Query params:
+    - movie_id: a single id; answered as {"recommended": bool, ...movie}
+    - movie_ids: several ids (comma-separated); answered as {"results": [...]}
+      with one {"id", "recommended", ...movie} entry per id
 
-    try:
-        recommended = get_recommendations(request.user)
-    except Exception:
-        recommended = []
+    Membership is read from the cached Top Picks payload (see
+    `get_top_picks_api`), so a check costs one cache read, or one indexed
+    query when the picks changed since they were last cached.
+    """
+    batch = 'movie_ids' in request.GET
+    movie_ids = _parse_movie_ids(request)
+    if not request.user or not request.user.is_authenticated:
+        movie_ids = []
 
-    for m in recommended:
+    picks = {}
+    if movie_ids:
         try:
-            if m.id == movie_id and getattr(m, 'archived_at', None) is None:
-                poster_url = ''
-                try:
-                    if m.poster:
-                        poster_url = m.poster.url
-                except Exception:
-                    poster_url = ''
-                return JsonResponse({
-                    'recommended': True,
-                    'id': m.id,
-                    'title': m.title,
-                    'genre': m.genre,
-                    'release_year': m.release_year,
-                    'description': m.description,
-                    'poster': poster_url,
-                })
+            picks = {p['id']: p for p in _top_picks_payload(request.user)}
         except Exception:
-            continue
+            picks = {}
+
+    def status(movie_id):
+        pick = picks.get(movie_id)
+        return dict(pick, recommended=True) if pick else {'id': movie_id, 'recommended': False}
+
+    if batch:
+        return JsonResponse({'results': [status(movie_id) for movie_id in movie_ids]})
+    if not movie_ids:
+        return JsonResponse({'recommended': False})
+    return JsonResponse(status(movie_ids[0]))
+
 
-    return JsonResponse({'recommended': False})
+def _poster_url(movie):
+    try:
+        return movie.poster.url if movie.poster else ''
+    except Exception:
+        return ''
 
 
 @login_required(login_url='login')
@@ -553,17 +658,16 @@ def add_movie(request):
             genre=genre,
             release_year=release_year,
             description=description,
-            poster=poster
         )
+        # The poster is stored and resized by a background job (see moviehub.posters).
+        job = posters.stage_upload(movie, poster) if poster else None
         # If this is an AJAX/fetch request, return JSON so client can update the UI immediately.
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            poster_url = ''
-            try:
-                if movie.poster:
-                    poster_url = movie.poster.url
-            except Exception:
-                poster_url = ''
-            return JsonResponse({'status': 'ok', 'action': 'added', 'id': movie.id, 'title': movie.title, 'poster': poster_url})
+            return JsonResponse({
+                'status': 'ok', 'action': 'added', 'id': movie.id, 'title': movie.title, 'poster': '',
+                'poster_status': 'pending' if job else 'none',
+                'poster_job': job.id if job else None,
+            })
 
         messages.success(request, f"Movie '{movie.title}' added successfully.")
         return redirect('admin_dashboard')
@@ -579,18 +683,14 @@ def edit_movie(request, movie_id):
         movie.genre = request.POST.get('genre')
         movie.release_year = request.POST.get('release_year')
         movie.description = request.POST.get('description')
-        if request.FILES.get('poster'):
-            movie.poster = request.FILES.get('poster')
         movie.save()
+        # A new poster replaces the current one once its background job has run.
+        new_poster = request.FILES.get('poster')
+        job = posters.stage_upload(movie, new_poster) if new_poster else None
         
         # If this is an AJAX request, return JSON so client can update the UI immediately
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            poster_url = ''
-            try:
-                if movie.poster:
-                    poster_url = movie.poster.url
-            except Exception:
-                poster_url = ''
+            poster_url = _poster_url(movie)
             return JsonResponse({
                 'status': 'ok',
                 'action': 'edited',
@@ -600,6 +700,8 @@ def edit_movie(request, movie_id):
                 'release_year': movie.release_year,
                 'description': movie.description,
                 'poster': poster_url,
+                'poster_status': 'pending' if job else ('ready' if poster_url else 'none'),
+                'poster_job': job.id if job else None,
             })
         
         messages.success(request, f"Movie '{movie.title}' updated successfully.")
@@ -607,17 +709,18 @@ def edit_movie(request, movie_id):
     
     # Prepare the same context as admin_dashboard so the template can render correctly
     movies = Movie.objects.all()
-    ratings = Rating.objects.all()
-    users = User.objects.filter(is_superuser=False, is_staff=False)
-    if ratings.exists():
-        avg_rating = round(sum(r.value for r in ratings) / ratings.count(), 1)
-    else:
-        avg_rating = 0
+    ratings, ratings_cursor, ratings_total, avg_rating = _admin_rating_summary()
+    users, users_cursor = timestamp_page(_admin_user_rows(), 'date_joined')
+    users_total = User.objects.filter(is_superuser=False, is_staff=False).count()
 
     return render(request, 'pages/admin_dashboard.html', {
         'movies': movies,
         'ratings': ratings,
+        'ratings_cursor': ratings_cursor,
+        'ratings_total': ratings_total,
         'users': users,
+        'users_cursor': users_cursor,
+        'users_total': users_total,
         'avg_rating': avg_rating,
         'movie': movie,
     })
@@ -629,8 +732,7 @@ def edit_movie(request, movie_id):
 def archive_movie(request, movie_id):
     """Archive a movie instead of deleting it."""
     movie = get_object_or_404(Movie, id=movie_id)
-    movie.archived_at = timezone.now()
-    movie.save()
+    movie.archive()
     # If this is an AJAX request, return JSON to allow immediate UI updates
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
@@ -648,8 +750,7 @@ def archive_movie(request, movie_id):
 def restore_movie(request, movie_id):
     """Restore an archived movie."""
     movie = get_object_or_404(Movie, id=movie_id)
-    movie.archived_at = None
-    movie.save()
+    movie.restore()
     if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.method == 'POST':
         poster_url = ''
         try:
@@ -691,7 +792,22 @@ def admin_movie_api(request, movie_id):
         'description': movie.description,
         'poster': poster_url,
         'average_rating': movie.average_rating(),
-        'rating_count': movie.ratings.count(),
+        'rating_count': movie.rating_count,
+    })
+
+
+@require_GET
+@login_required(login_url='login')
+@user_passes_test(is_admin, login_url='login')
+def admin_job_api(request, job_id):
+    """Status of a background job, e.g. the `poster_job` returned by add/edit."""
+    job = get_object_or_404(Job, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'movie_id': job.kwargs.get('movie_id'),
+        'error': job.last_error.strip().splitlines()[-1] if job.status == Job.FAILED and job.last_error else None,
     })
 
 
@@ -718,8 +834,7 @@ def permanently_delete_movie(request, movie_id):
 def delete_movie(request, movie_id):
     """Legacy endpoint - now archives instead of deleting."""
     movie = get_object_or_404(Movie, id=movie_id)
-    movie.archived_at = timezone.now()
-    movie.save()
+    movie.archive()
     return redirect('admin_dashboard')
 
 
@@ -800,6 +915,8 @@ def edit_profile(request):
 
 
 @require_GET
+@condition(etag_func=_catalog_etag)
+@cache_control(private=True, no_cache=True)
 def movies_updates_api(request):
     """API endpoint for polling new movies.
     
@@ -957,125 +1074,230 @@ def reset_password_with_otp(request):
         return JsonResponse({'status': 'error', 'message': 'An error occurred'}, status=500)
 
 
+def _top_picks_cache_key(user_id):
+    return f'moviehub:top-picks:{user_id}'
+
+
+def _top_picks_lookup(user):
+    # Picks change with the user's stored ranking (whose token also moves
+    # when one of their averages does), their titles with the catalog, and
+    # the user's own stars with their ratings.
+    return versions.lookup(
+        _top_picks_cache_key(user.id),
+        (versions.RECOMMENDATIONS, user.id), (versions.RATINGS, user.id), versions.CATALOG,
+    )
+
+
+def _build_top_picks(user, tag):
+    # Averages and counts come from the denormalized rating_sum /
+    # rating_count columns, loaded with the picks in one query.
+    movies = get_precomputed_recommendations(user)
+    user_ratings = _user_ratings_for(user, movies)
+    payload = [
+        dict(_movie_card_payload(movie, user_ratings), rating_count=movie.rating_count)
+        for movie in movies
+    ]
+    versions.remember(_top_picks_cache_key(user.id), tag, payload)
+    return payload
+
+
+def _top_picks_payload(user):
+    """The user's Top Picks as card payloads, cached until they change."""
+    tag, payload = _top_picks_lookup(user)
+    if payload is None:
+        payload = _build_top_picks(user, tag)
+    return payload
+
+
+def _top_picks_etag(request, *args, **kwargs):
+    # The same cache read also returns the payload cached for this ETag,
+    # which the view picks up from the request.
+    tag, payload = _top_picks_lookup(request.user)
+    request._top_picks = (tag, payload)
+    return tag
+
+
 @login_required
 @require_GET
+@condition(etag_func=_top_picks_etag)
+@cache_control(private=True, no_cache=True)
 def get_top_picks_api(request):
     """API endpoint to get recommended movies (top picks) for the current user.
     
-    Returns a JSON list of recommended movies with their details.
+    Returns a JSON list of recommended movies with their details. The list is
+    cached per user until their picks (or the averages shown), the catalog or
+    their own ratings change, so a warm call costs one cache read.
     """
-    try:
-        recommended_movies = get_recommendations(request.user)
-        
-        result = []
-        for movie in recommended_movies:
-            poster_url = ''
-            try:
-                if movie.poster:
-                    poster_url = f"/media/{movie.poster}"
-            except Exception:
-                poster_url = ''
-            
-            # Get average rating and rating count
-            avg_rating = 0
-            rating_count = 0
-            try:
-                ratings = Rating.objects.filter(movie=movie)
-                if ratings.exists():
-                    rating_count = ratings.count()
-                    avg_rating = sum(r.rating for r in ratings) / rating_count
-            except Exception:
-                pass
-            
-            result.append({
-                'id': movie.id,
-                'title': movie.title,
-                'genre': movie.genre or '',
-                'release_year': movie.release_year or '',
-                'description': movie.description or '',
-                'poster': poster_url,
-                'average_rating': round(avg_rating, 1) if avg_rating else 0,
-                'rating_count': rating_count,
-            })
-        
-        return JsonResponse(result, safe=False)
-    
-    except Exception as e:
-        print(f"Error in get_top_picks_api: {e}")
-        return JsonResponse({'error': 'Failed to fetch recommendations'}, status=500)
+    tag, payload = getattr(request, '_top_picks', (None, None))
+    if payload is None:
+        try:
+            payload = _build_top_picks(request.user, tag)
+        except Exception as e:
+            print(f"Error in get_top_picks_api: {e}")
+            return JsonResponse({'error': 'Failed to fetch recommendations'}, status=500)
+    return JsonResponse(payload, safe=False)
 
 
+# How far back each `server_time` handed to the users poll reaches, so a
+# rating stamped just before a transaction committed is not missed.
+USERS_POLL_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def _admin_user_rows():
+    """Regular users (not admins) with their rating count, in one grouped query."""
+    return (
+        User.objects.filter(is_superuser=False, is_staff=False)
+        .annotate(ratings_given=Count('rating'))
+        .values('id', 'username', 'email', 'date_joined', 'ratings_given')
+    )
+
+
+def _admin_user_payload(row):
+    date_joined = row['date_joined']
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'email': row['email'],
+        'ratings_given': row['ratings_given'],
+        'date_joined': date_joined.strftime('%b %d, %Y') if date_joined else 'Unknown',
+        'date_joined_iso': date_joined.isoformat() if date_joined else '',
+    }
+
+
+def _admin_users_etag(request, *args, **kwargs):
+    if not (request.user.is_authenticated and (request.user.is_superuser or request.user.is_staff)):
+        return None
+    return versions.etag(versions.USERS, versions.RATINGS)
+
+
+@condition(etag_func=_admin_users_etag)
+@cache_control(private=True, no_cache=True)
 def admin_users_api(request):
-    """API endpoint to fetch all users data for admin dashboard"""
+    """API endpoint for the admin users table, newest first.
+
+    Query params:
+    - cursor: `next_cursor` from the previous page (omit for the first page)
+    - page_size: rows per page (default 50, max 500)
+    - updated_since: ISO timestamp (usually the previous `server_time`); only
+      users who joined or whose rating count changed since then are returned
+
+    Returns {"results": [...], "next_cursor": str|null, "server_time": str}.
+    """
     if not request.user.is_authenticated or not (request.user.is_superuser or request.user.is_staff):
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
     try:
-        # Fetch regular users only (not admins)
-        users = User.objects.filter(is_superuser=False, is_staff=False).order_by('-date_joined')
-        
-        result = []
-        for user in users:
-            try:
-                rating_count = user.rating_set.count()
-            except Exception:
-                rating_count = 0
-            
-            result.append({
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'ratings_given': rating_count,
-                'date_joined': user.date_joined.strftime('%b %d, %Y') if user.date_joined else 'Unknown',
-                'date_joined_iso': user.date_joined.isoformat() if user.date_joined else '',
-            })
-        
-        return JsonResponse(result, safe=False)
+        server_time = timezone.now() - USERS_POLL_OVERLAP
+        users = _admin_user_rows()
+
+        updated_since = request.GET.get('updated_since')
+        if updated_since:
+            since = parse_datetime(updated_since)
+            if since is None:
+                return JsonResponse({'error': 'updated_since must be an ISO 8601 timestamp'}, status=400)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            users = users.filter(Q(date_joined__gte=since) | Q(profile__ratings_changed_at__gte=since))
+
+        rows, next_cursor = timestamp_page(
+            users,
+            'date_joined',
+            cursor=request.GET.get('cursor'),
+            page_size=parse_page_size(request.GET.get('page_size')),
+        )
+        return JsonResponse({
+            'results': [_admin_user_payload(row) for row in rows],
+            'next_cursor': next_cursor,
+            'server_time': server_time.isoformat(),
+        })
     
     except Exception as e:
         print(f"Error in admin_users_api: {e}")
         return JsonResponse({'error': 'Failed to fetch users'}, status=500)
 
 
+def _admin_rating_rows():
+    """Ratings projected to what the admin table shows: one joined query per page."""
+    return Rating.objects.values('id', 'value', 'created_at', 'user__username', 'movie__title')
+
+
+def _admin_rating_payload(row):
+    created_at = row['created_at']
+    return {
+        'id': row['id'],
+        'user': row['user__username'] or 'Unknown',
+        'movie': row['movie__title'] or 'Unknown',
+        'value': row['value'],
+        'created_at': created_at.strftime('%b %d, %Y') if created_at else 'Recent',
+        'created_at_iso': created_at.isoformat() if created_at else '',
+    }
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _stream_ratings_csv():
+    writer = csv.writer(_Echo())
+    rows = _admin_rating_rows().order_by(F('created_at').desc(nulls_last=True), '-id').iterator(chunk_size=2000)
+
+    def lines():
+        yield writer.writerow(['id', 'user', 'movie', 'value', 'created_at'])
+        for row in rows:
+            yield writer.writerow([
+                row['id'], row['user__username'], row['movie__title'], row['value'],
+                row['created_at'].isoformat() if row['created_at'] else '',
+            ])
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="ratings.csv"'
+    return response
+
+
+def _admin_ratings_etag(request, *args, **kwargs):
+    if request.GET.get('export'):
+        return None
+    if not (request.user.is_authenticated and (request.user.is_superuser or request.user.is_staff)):
+        return None
+    return versions.etag(versions.RATINGS, versions.USERS, versions.CATALOG)
+
+
+@condition(etag_func=_admin_ratings_etag)
+@cache_control(private=True, no_cache=True)
 def admin_ratings_api(request):
-    """API endpoint to fetch all ratings data for admin dashboard"""
+    """API endpoint for the admin ratings table, newest first.
+
+    Query params:
+    - cursor: `next_cursor` from the previous page (omit for the first page)
+    - page_size: rows per page (default 50, max 500)
+    - export=csv: stream every rating as a CSV download instead
+
+    Returns {"results": [...], "next_cursor": str|null}.
+    """
     if not request.user.is_authenticated or not (request.user.is_superuser or request.user.is_staff):
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    
+
+    if not schema.ratings_ready():
+        return JsonResponse({'results': [], 'next_cursor': None})
+
     try:
-        # Check if created_at column exists in Rating table
-        def _table_has_column(model, column_name):
-            try:
-                table_name = model._meta.db_table
-                with connection.cursor() as cursor:
-                    cols = [c.name for c in connection.introspection.get_table_description(cursor, table_name)]
-                return column_name in cols
-            except Exception:
-                return False
-        
-        ratings = []
-        if _table_has_column(Rating, 'created_at'):
-            try:
-                ratings = Rating.objects.all().order_by('-created_at')
-            except Exception:
-                ratings = []
-        
-        result = []
-        for rating in ratings:
-            try:
-                result.append({
-                    'id': rating.id,
-                    'user': rating.user.username if rating.user else 'Unknown',
-                    'movie': rating.movie.title if rating.movie else 'Unknown',
-                    'value': rating.value,
-                    'created_at': rating.created_at.strftime('%b %d, %Y') if hasattr(rating, 'created_at') and rating.created_at else 'Recent',
-                    'created_at_iso': rating.created_at.isoformat() if hasattr(rating, 'created_at') and rating.created_at else '',
-                })
-            except Exception:
-                pass
-        
-        return JsonResponse(result, safe=False)
-    
+        if request.GET.get('export') == 'csv':
+            return _stream_ratings_csv()
+
+        rows, next_cursor = timestamp_page(
+            _admin_rating_rows(),
+            'created_at',
+            cursor=request.GET.get('cursor'),
+            page_size=parse_page_size(request.GET.get('page_size')),
+        )
+        return JsonResponse({
+            'results': [_admin_rating_payload(row) for row in rows],
+            'next_cursor': next_cursor,
+        })
+
     except Exception as e:
         print(f"Error in admin_ratings_api: {e}")
         return JsonResponse({'error': 'Failed to fetch ratings'}, status=500)
\ No newline at end of file
@@ -2,6 +2,8 @@
 ASGI config for redmovierec_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the entry point used in production (see render.yaml): the dashboard's
+server-sent event stream (``moviehub.events``) needs an async server.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -101,6 +101,36 @@ DATABASES = {
     )
 }
 
+# Cache shared by all worker processes (facets, version counters, payloads).
+# It holds a few keys per user (their ratings and picks tokens and the Top
+# Picks payload), so it must not be culled at Django's default 300 entries:
+# a culled token costs every client a full refetch.
+if 'REDIS_URL' in os.environ:
+    # Render Key Value / any Redis: no per-write row count, batched set_many.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    # The table is created by `python manage.py createcachetable` (see build.sh).
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'moviehub_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 200_000)),
+                'CULL_FREQUENCY': 10,
+            },
+        }
+    }
+
+# Background jobs (moviehub.jobs) normally wait for `manage.py run_worker`.
+# With DEBUG on they run in-process after each commit, so local development
+# works without a worker; set MOVIEHUB_JOBS_INLINE to override either way.
+MOVIEHUB_JOBS_INLINE = os.environ.get('MOVIEHUB_JOBS_INLINE', str(DEBUG)) == 'True'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -11,55 +11,49 @@ if ROOT not in sys.path:
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'redmovierec_project.settings')
 django.setup()
 from django.utils import timezone
-from moviehub.models import Rating
+from moviehub import activity
 
 now = timezone.now()
 
 # Weekly (last 4 weeks)
 print('--- Weekly (last 4 weeks) ---')
-current_monday = (now.date() - datetime.timedelta(days=now.weekday()))
-weekly_labels = []
-weekly_counts = []
-for i in range(3, -1, -1):
-    week_start = current_monday - datetime.timedelta(weeks=i)
-    week_end = week_start + datetime.timedelta(days=6)
-    count = Rating.objects.filter(created_at__date__gte=week_start, created_at__date__lte=week_end).values('user').distinct().count()
-    weekly_labels.append(f"{week_start.strftime('%b %d')} - {week_end.strftime('%b %d')}")
-    weekly_counts.append(count)
+weekly = activity.active_users(activity.WEEKLY, 4, now=now)
+weekly_labels = [
+    f"{b['start'].strftime('%b %d')} - {(b['end'] - datetime.timedelta(days=1)).strftime('%b %d')}"
+    for b in weekly
+]
+weekly_counts = [b['count'] for b in weekly]
 print('labels:', weekly_labels)
 print('counts:', weekly_counts)
 
 # Monthly (last 12 months)
 print('\n--- Monthly (last 12 months) ---')
-first_of_month = datetime.date(now.year, now.month, 1)
-
-def month_shift(dt, shift):
-    year = dt.year + ((dt.month - 1 + shift) // 12)
-    month = (dt.month - 1 + shift) % 12 + 1
-    return datetime.date(year, month, 1)
-
-monthly_labels = []
-monthly_counts = []
-for i in range(11, -1, -1):
-    m = month_shift(first_of_month, -i)
-    c = Rating.objects.filter(created_at__year=m.year, created_at__month=m.month).values('user').distinct().count()
-    monthly_labels.append(m.strftime('%b %Y'))
-    monthly_counts.append(c)
+monthly = activity.active_users(activity.MONTHLY, 12, now=now)
+monthly_labels = [b['start'].strftime('%b %Y') for b in monthly]
+monthly_counts = [b['count'] for b in monthly]
 print('labels:', monthly_labels)
 print('counts:', monthly_counts)
 
 # Yearly (last 3 years)
 print('\n--- Yearly (last 3 years) ---')
-yearly_labels = []
-yearly_counts = []
-for i in range(2, -1, -1):
-    y = now.year - i
-    c = Rating.objects.filter(created_at__year=y).values('user').distinct().count()
-    yearly_labels.append(str(y))
-    yearly_counts.append(c)
+yearly = activity.active_users(activity.YEARLY, 3, now=now)
+yearly_labels = [str(b['start'].year) for b in yearly]
+yearly_counts = [b['count'] for b in yearly]
 print('labels:', yearly_labels)
 print('counts:', yearly_counts)
 
+# Any custom range merges the same per-day sketches
+today = timezone.localdate(now)
+print('\n--- Active users, last 90 days ---')
+print('count:', activity.active_users_between(today - datetime.timedelta(days=89), today + datetime.timedelta(days=1)))
+
+# Additive metrics from the daily rollup (last 12 months)
+print('\n--- Ratings / new users per month (last 12 months) ---')
+ratings = activity.series(activity.MONTHLY, 12, activity.RATINGS, now=now)
+new_users = activity.series(activity.MONTHLY, 12, activity.NEW_USERS, now=now)
+print('ratings:  ', [b['count'] for b in ratings])
+print('new users:', [b['count'] for b in new_users])
+
 # Scales (0-5) for weekly example
 print('\n--- Scaled (weekly) ---')
 if weekly_counts and max(weekly_counts) > 0: